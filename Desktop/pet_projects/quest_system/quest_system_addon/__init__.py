@@ -22,9 +22,13 @@
 import os
 import sys
 import bpy
+import time
 import typing
 
 
+_import_start = time.perf_counter()
+
+
 ADDITIONAL_DEPS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "python_deps"))
 try:
     if os.path.isdir(ADDITIONAL_DEPS_DIR) and ADDITIONAL_DEPS_DIR not in sys.path:
@@ -34,15 +38,13 @@ try:
         import polib
         from . import ui
         from . import preferences
-        from . import loader
-        from . import logic
+        from . import startup
     else:
         import importlib
         polib = importlib.reload(polib)
         ui = importlib.reload(ui)
         preferences = importlib.reload(preferences)
-        loader = importlib.reload(loader)
-        logic = importlib.reload(logic)
+        startup = importlib.reload(startup)
 
 finally:
     if ADDITIONAL_DEPS_DIR in sys.path:
@@ -60,28 +62,30 @@ bl_info = {
     "tracker_url": "https://polygoniq.com/discord"
 }
 telemetry = polib.get_telemetry("quest_system")
-telemetry.report_addon(bl_info, __file__)
+# Addon is reported to telemetry by startup once the deferred modules are loaded
+startup.record_timing("import", time.perf_counter() - _import_start)
 
 
 ADDON_CLASSES: typing.List[typing.Type] = []
 
 
 def register():
+    start = time.perf_counter()
+    # Everything else is registered by startup when the panel is shown for the first time
     preferences.register()
     ui.register()
-    loader.register()
-    logic.register()
+    startup.register()
 
     for cls in ADDON_CLASSES:
         telemetry.wrap_blender_class(cls)
         bpy.utils.register_class(cls)
+    startup.record_timing("register", time.perf_counter() - start)
 
 
 def unregister():
     for cls in reversed(ADDON_CLASSES):
         bpy.utils.unregister_class(cls)
 
-    logic.unregister()
-    loader.unregister()
+    startup.unregister()
     ui.unregister()
     preferences.unregister()
@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Local store of learner activity: task starts, step submissions with their result and the time
+# each step took from being unlocked to being completed. Used to find the quests which stall
+# learners. Records are queued and written by a background thread in batches, at most one
+# transaction per FLUSH_INTERVAL, so checking steps never waits for the disk.
+#
+# This module doesn't depend on bpy, the report can be printed from command line:
+#   python analytics.py DATABASE_PATH [--limit N]
+
+import os
+import sys
+import time
+import uuid
+import queue
+import typing
+import sqlite3
+import logging
+import argparse
+import threading
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+DATABASE_FILENAME = "analytics.sqlite"
+SCHEMA_VERSION = 1
+FLUSH_INTERVAL = 1.0
+MAX_BATCH_SIZE = 512
+# Steps with fewer submissions are left out of failure rates, one failure isn't a trend
+MIN_SUBMISSIONS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_starts (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    session TEXT NOT NULL,
+    task_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    session TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    step_id TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    check_duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS step_completions (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    session TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    step_id TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_starts_task ON task_starts (task_id);
+-- Covering indices of the report queries, grouping reads only the index
+CREATE INDEX IF NOT EXISTS submissions_step ON submissions (task_id, step_id, passed);
+CREATE INDEX IF NOT EXISTS step_completions_step ON step_completions (task_id, step_id, duration);
+"""
+
+TABLE_COLUMNS: typing.Dict[str, typing.Tuple[str, ...]] = {
+    "task_starts": ("time", "session", "task_id"),
+    "submissions": ("time", "session", "task_id", "step_id", "passed", "check_duration"),
+    "step_completions": ("time", "session", "task_id", "step_id", "duration"),
+}
+
+
+# Distinguishes runs of Blender in the records
+SESSION = uuid.uuid4().hex
+
+# (table, row) records waiting for the writer, None stops it
+_queue: "queue.Queue[typing.Optional[typing.Tuple[str, typing.Tuple[typing.Any, ...]]]]" = queue.Queue()
+_writer: typing.Optional[threading.Thread] = None
+# Times steps of the current task were unlocked at, by step id
+_task_id: typing.Optional[str] = None
+_available_since: typing.Dict[str, float] = {}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    # Readers of the report don't block the writer
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        connection.executescript(SCHEMA)
+        connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return connection
+
+
+def _write_batch(
+    connection: sqlite3.Connection,
+    batch: typing.List[typing.Tuple[str, typing.Tuple[typing.Any, ...]]]
+) -> None:
+    rows_by_table: typing.Dict[str, typing.List[typing.Tuple[typing.Any, ...]]] = {}
+    for table, row in batch:
+        rows_by_table.setdefault(table, []).append(row)
+    with connection:
+        for table, rows in rows_by_table.items():
+            columns = TABLE_COLUMNS[table]
+            connection.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+def _run_writer(path: str) -> None:
+    try:
+        connection = connect(path)
+    except sqlite3.Error as e:
+        logger.error(f"Couldn't open analytics database '{path}': {e}")
+        connection = None
+
+    stop = False
+    while not stop:
+        batch = [_queue.get()]
+        # Whatever comes in the next FLUSH_INTERVAL goes into the same transaction
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while batch[-1] is not None and len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0.0:
+                break
+            try:
+                batch.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        stop = batch[-1] is None
+        records = [record for record in batch if record is not None]
+        if connection is not None and len(records) > 0:
+            try:
+                _write_batch(connection, records)
+            except sqlite3.Error as e:
+                logger.error(f"Couldn't write {len(records)} analytics records: {e}")
+        for _ in batch:
+            _queue.task_done()
+
+    if connection is not None:
+        connection.close()
+
+
+def open_store(path: str) -> None:
+    """Starts the writer of the database at 'path', records before this are dropped"""
+    global _writer
+    if _writer is not None:
+        return
+    _writer = threading.Thread(target=_run_writer, args=(path, ), name="quest_system_analytics", daemon=True)
+    _writer.start()
+
+
+def close_store(timeout: float = 5.0) -> None:
+    """Writes out queued records and stops the writer"""
+    global _writer
+    if _writer is None:
+        return
+    _queue.put(None)
+    _writer.join(timeout)
+    _writer = None
+
+
+def flush() -> None:
+    """Blocks until all queued records are written"""
+    if _writer is not None:
+        _queue.join()
+
+
+def _record(table: str, *row: typing.Any) -> None:
+    if _writer is not None:
+        _queue.put_nowait((table, (time.time(), SESSION) + row))
+
+
+def record_task_start(task_id: str) -> None:
+    global _task_id
+    _task_id = task_id
+    _available_since.clear()
+    _record("task_starts", task_id)
+
+
+def record_submission(task_id: str, step_id: str, passed: bool, check_duration: float) -> None:
+    _record("submissions", task_id, step_id, int(passed), check_duration)
+
+
+def track_available_steps(task_id: str, step_ids: typing.Iterable[str]) -> None:
+    """Remembers when steps were unlocked, called whenever the unlocked steps could change"""
+    global _task_id
+    if task_id != _task_id:
+        _task_id = task_id
+        _available_since.clear()
+    step_ids = set(step_ids)
+    for step_id in list(_available_since):
+        if step_id not in step_ids:
+            del _available_since[step_id]
+    now = time.time()
+    for step_id in step_ids:
+        _available_since.setdefault(step_id, now)
+
+
+def record_step_completed(task_id: str, step_id: str) -> None:
+    if task_id != _task_id:
+        return
+    since = _available_since.pop(step_id, None)
+    # Steps of a resumed task weren't unlocked in this session, their time is unknown
+    if since is not None:
+        _record("step_completions", task_id, step_id, time.time() - since)
+
+
+def query_task_starts(connection: sqlite3.Connection) -> typing.List[typing.Tuple[str, int]]:
+    return connection.execute(
+        "SELECT task_id, COUNT(*) AS starts FROM task_starts GROUP BY task_id ORDER BY starts DESC").fetchall()
+
+
+def query_slowest_steps(connection: sqlite3.Connection) -> typing.List[typing.Tuple[str, str, float, int]]:
+    """Returns (task id, step id, mean duration, completions) of the slowest step of every task"""
+    return connection.execute("""
+        SELECT task_id, step_id, mean_duration, completions FROM (
+            SELECT task_id, step_id, AVG(duration) AS mean_duration, COUNT(*) AS completions,
+                RANK() OVER (PARTITION BY task_id ORDER BY AVG(duration) DESC) AS rank
+            FROM step_completions GROUP BY task_id, step_id
+        ) WHERE rank = 1 ORDER BY mean_duration DESC
+    """).fetchall()
+
+
+def query_failure_rates(
+    connection: sqlite3.Connection,
+    limit: int = 10,
+    min_submissions: int = MIN_SUBMISSIONS
+) -> typing.List[typing.Tuple[str, str, float, int]]:
+    """Returns (task id, step id, failure rate, submissions) of steps failed most often"""
+    return connection.execute("""
+        SELECT task_id, step_id, 1.0 - AVG(passed) AS failure_rate, COUNT(*) AS submissions
+        FROM submissions GROUP BY task_id, step_id
+        HAVING submissions >= ? ORDER BY failure_rate DESC, submissions DESC LIMIT ?
+    """, (min_submissions, limit)).fetchall()
+
+
+def format_report(connection: sqlite3.Connection, limit: int = 10) -> str:
+    lines = ["Task starts:"]
+    lines.extend(f"  {task_id}: {starts}" for task_id, starts in query_task_starts(connection))
+    lines.append("Slowest step per task:")
+    lines.extend(
+        f"  {task_id}/{step_id}: {mean_duration:.1f} s on average, {completions} completions"
+        for task_id, step_id, mean_duration, completions in query_slowest_steps(connection))
+    lines.append(f"Highest failure rate (at least {MIN_SUBMISSIONS} submissions):")
+    lines.extend(
+        f"  {task_id}/{step_id}: {failure_rate:.0%} of {submissions} submissions failed"
+        for task_id, step_id, failure_rate, submissions in query_failure_rates(connection, limit))
+    return "\n".join(lines)
+
+
+def register():
+    import bpy
+    # Background runs are validation and benchmarks, not learners
+    if bpy.app.background:
+        return
+    config_path = bpy.utils.user_resource('CONFIG', path="quest_system", create=True)
+    open_store(os.path.join(config_path, DATABASE_FILENAME))
+
+
+def unregister():
+    close_store()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints report of the quest_system analytics database")
+    parser.add_argument("database")
+    parser.add_argument("--limit", type=int, default=10, help="Number of steps with the highest failure rate")
+    args = parser.parse_args()
+    if not os.path.isfile(args.database):
+        print(f"Analytics database '{args.database}' doesn't exist", file=sys.stderr)
+        sys.exit(1)
+    db_connection = connect(args.database)
+    print(format_report(db_connection, args.limit))
+    db_connection.close()
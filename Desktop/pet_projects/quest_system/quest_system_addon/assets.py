@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Asset libraries tasks declare in "asset_libraries" (e.g. traffiq vehicles). Libraries are
+# linked, not appended, and only once per file, every task using them reuses the linked
+# collections and only instances them into its scene. Linked datablocks survive task restarts.
+#
+# Reading a large .blend from disk is most of the stall when a task starts. While the learner
+# works on a task, the libraries of the likely next task are read in a background thread, which
+# brings them into the OS file cache, so linking them later is fast. bpy is only used on the main
+# thread.
+
+import os
+import bpy
+import time
+import typing
+import logging
+import concurrent.futures
+
+
+if "catalog" not in locals():
+    from . import catalog
+    from . import profiling
+else:
+    import importlib
+    catalog = importlib.reload(catalog)
+    profiling = importlib.reload(profiling)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+READ_CHUNK_SIZE = 4 * 2**20
+
+
+_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+# Prefetches of library files by absolute path, done or in progress
+_prefetches: typing.Dict[str, concurrent.futures.Future] = {}
+
+
+def get_library_path(library: typing.Dict[str, typing.Any]) -> str:
+    return os.path.join(catalog.QUESTS_PATH, library["file"])
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        # One thread, libraries are read sequentially so they don't compete for the disk
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="quest_system_prefetch")
+    return _executor
+
+
+def _read_file(path: str) -> int:
+    """Reads the whole file so it is in the OS file cache, returns its size"""
+    start = time.perf_counter()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            size += len(chunk)
+    # profiling isn't thread safe, only the duration is logged here
+    logger.debug(f"Prefetched '{path}', {size / 2**20:.1f} MiB in {time.perf_counter() - start:.2f} s")
+    return size
+
+
+def prefetch(libraries: typing.Iterable[typing.Dict[str, typing.Any]]) -> None:
+    """Starts reading 'libraries' in the background, libraries linked or prefetched already are skipped"""
+    for library in libraries:
+        path = get_library_path(library)
+        if path in _prefetches or _find_library(path) is not None or not os.path.isfile(path):
+            continue
+        _prefetches[path] = _get_executor().submit(_read_file, path)
+
+
+def _find_library(path: str) -> typing.Optional[bpy.types.Library]:
+    path = os.path.normcase(os.path.abspath(path))
+    for library in bpy.data.libraries:
+        if os.path.normcase(os.path.abspath(bpy.path.abspath(library.filepath))) == path:
+            return library
+    return None
+
+
+def _get_linked_collection(library: bpy.types.Library, name: str) -> typing.Optional[bpy.types.Collection]:
+    # Local datablocks can have the same name, the key includes the library
+    return bpy.data.collections.get((name, library.filepath), None)
+
+
+def link(library: typing.Dict[str, typing.Any]) -> typing.List[bpy.types.Collection]:
+    """Returns collections of 'library', links only those which aren't linked yet"""
+    path = get_library_path(library)
+    if not os.path.isfile(path):
+        logger.error(f"Asset library '{path}' doesn't exist")
+        return []
+
+    linked_library = _find_library(path)
+    names = library["collections"]
+    missing = names if linked_library is None else \
+        [name for name in names if _get_linked_collection(linked_library, name) is None]
+    if len(missing) > 0:
+        with profiling.measure(f"assets:link:{library['file']}"):
+            with bpy.data.libraries.load(path, link=True) as (data_from, data_to):
+                unknown = set(missing).difference(data_from.collections)
+                if len(unknown) > 0:
+                    logger.error(f"Asset library '{path}' doesn't contain collections {sorted(unknown)}")
+                data_to.collections = [name for name in missing if name not in unknown]
+        linked_library = _find_library(path)
+    # The file was read now, a prefetch of it is pointless
+    _prefetches.pop(path, None)
+
+    if linked_library is None:
+        return []
+    collections = (_get_linked_collection(linked_library, name) for name in names)
+    return [collection for collection in collections if collection is not None]
+
+
+def instantiate(
+    libraries: typing.Iterable[typing.Dict[str, typing.Any]],
+    collection: bpy.types.Collection
+) -> typing.List[bpy.types.Object]:
+    """Links 'libraries' and adds an instance of each of their collections to 'collection'"""
+    instances = []
+    for library in libraries:
+        for linked_collection in link(library):
+            instance = bpy.data.objects.new(linked_collection.name, None)
+            instance.instance_type = 'COLLECTION'
+            instance.instance_collection = linked_collection
+            collection.objects.link(instance)
+            instances.append(instance)
+    return instances
+
+
+def clear_prefetches() -> None:
+    for future in _prefetches.values():
+        future.cancel()
+    _prefetches.clear()
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    # Prefetches were meant for tasks of the previous file
+    clear_prefetches()
+
+
+def register():
+    bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    global _executor
+    bpy.app.handlers.load_post.remove(_load_post)
+    clear_prefetches()
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Quest authoring mode: quest files are watched by a timer and tasks whose file changed are
+# parsed again and swapped into the catalog in place, no add-on reload needed. A file is only
+# parsed again when its mtime changed and its content hash too, editors often save unchanged
+# files. The task in progress is swapped as well, completed steps which still exist stay
+# completed and the scene isn't prepared again.
+
+import os
+import bpy
+import typing
+import hashlib
+import logging
+
+
+if "preferences" not in locals():
+    from . import preferences
+    from . import catalog
+    from . import loader
+    from . import logic
+    from . import progress
+    from . import auto_check
+    from . import background_check
+    from . import utils
+else:
+    import importlib
+    preferences = importlib.reload(preferences)
+    catalog = importlib.reload(catalog)
+    loader = importlib.reload(loader)
+    logic = importlib.reload(logic)
+    progress = importlib.reload(progress)
+    auto_check = importlib.reload(auto_check)
+    background_check = importlib.reload(background_check)
+    utils = importlib.reload(utils)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+POLL_INTERVAL = 1.0
+
+
+class WatchedFile:
+    __slots__ = ("mtime", "digest", "task_name")
+
+    def __init__(self, mtime: float, digest: typing.Optional[str], task_name: typing.Optional[str]) -> None:
+        self.mtime = mtime
+        # Hash of the content, None until the file is read by us
+        self.digest = digest
+        # None if the file couldn't be parsed
+        self.task_name = task_name
+
+
+# Quest files by path, empty while the authoring mode is off
+_watched: typing.Dict[str, WatchedFile] = {}
+
+
+def _get_digest(path: str) -> typing.Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _start_watching() -> None:
+    # mtimes from the catalog, files edited before the mode was turned on are reloaded too
+    for task in loader.get_catalog():
+        if task.entry is not None:
+            _watched[task.entry.path] = WatchedFile(task.entry.mtime, None, task.name)
+
+
+def _is_current_task_file(path: str) -> bool:
+    task = loader.current_task
+    return task is not None and task.entry is not None and task.entry.path == path
+
+
+def reload_file(path: str, mtime: float) -> None:
+    """Parses the quest file again and swaps its task into the catalog"""
+    task_catalog = loader.get_catalog()
+    watched = _watched.get(path, None)
+    old_name = watched.task_name if watched is not None else None
+    try:
+        entry = catalog.read_catalog_entry(path)
+    except Exception as e:
+        # Quest files are being edited, any mistake in them mustn't stop the watching
+        logger.error(f"Couldn't reload quest '{path}': {e!r}")
+        # The old version of the task stays until the file is fixed
+        _watched[path] = WatchedFile(mtime, _get_digest(path), old_name)
+        return
+
+    task = loader.make_task(entry)
+    owner = task_catalog.get_id_conflict(task, old_name)
+    if owner is not None:
+        logger.error(f"Couldn't reload quest '{path}', its id '{task.id}' is taken by task '{owner.name}'")
+        _watched[path] = WatchedFile(mtime, _get_digest(path), old_name)
+        return
+
+    if _is_current_task_file(path) and not _swap_current_task(task):
+        _watched[path] = WatchedFile(mtime, _get_digest(path), old_name)
+        return
+
+    if old_name is not None and old_name in task_catalog:
+        task_catalog.replace(old_name, task)
+    else:
+        task_catalog.add(task)
+    _watched[path] = WatchedFile(entry.mtime, _get_digest(path), task.name)
+    logger.info(f"Reloaded task '{task.name}' from '{path}'")
+
+
+def _swap_current_task(task: loader.Task) -> bool:
+    prefs = preferences.get_preferences(bpy.context)
+    try:
+        # Steps of other tasks are parsed lazily, errors of the played one have to show now
+        steps = task.steps
+    except Exception as e:
+        logger.error(f"Couldn't reload task '{task.name}' in progress: {e!r}")
+        return False
+
+    completed_step_ids = {
+        step_props.step_id for step_props in prefs.task.steps
+        if step_props.state == 'COMPLETED' and task.get_step(step_props.step_id) is not None
+    }
+    # Checks in flight hold steps of the old task
+    background_check.cancel()
+    loader.current_task = task
+    loader.sync_task_properties(task, prefs.task)
+    loader.apply_progress(task, prefs.task, completed_step_ids)
+    record = progress.read_record()
+    if record is not None:
+        # The id of the task could have changed too
+        progress.write_record(progress.ProgressRecord(
+            task.id, [step.id for step in steps if step.id in completed_step_ids], record.fingerprint))
+    # The scene isn't prepared again, only tests which don't capture the fresh scene are started.
+    # Rest positions captured when the task started are kept, they are stored with the objects.
+    for step in steps:
+        for test in step.tests:
+            on_task_start = getattr(test, "on_task_start", None)
+            if on_task_start is not None and not getattr(test, "captures_scene", False):
+                on_task_start()
+    logic.track_available_steps(prefs, task)
+    # Edited tests can already be satisfied
+    auto_check.schedule_check()
+    return True
+
+
+def _remove_file(path: str) -> None:
+    watched = _watched.pop(path)
+    if watched.task_name is None:
+        return
+    if _is_current_task_file(path):
+        logger.warning(f"Quest file of task '{watched.task_name}' in progress was removed, it can be finished")
+    loader.get_catalog().remove(watched.task_name)
+    logger.info(f"Removed task '{watched.task_name}', '{path}' doesn't exist anymore")
+
+
+def check_files() -> bool:
+    """Reloads changed quest files, returns whether anything was reloaded"""
+    if len(_watched) == 0:
+        _start_watching()
+
+    changed = False
+    paths = set(catalog.list_task_files(catalog.QUESTS_PATH))
+    for path in paths:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            # Removed meanwhile, picked up next time
+            continue
+        watched = _watched.get(path, None)
+        if watched is not None and watched.mtime == mtime:
+            continue
+        if watched is not None and watched.digest is not None and watched.digest == _get_digest(path):
+            watched.mtime = mtime
+            continue
+        try:
+            reload_file(path, mtime)
+        except Exception:
+            # Blender unregisters timers which raise, hot reload would stop for the session
+            logger.exception(f"Couldn't reload quest '{path}'")
+            old_name = watched.task_name if watched is not None else None
+            _watched[path] = WatchedFile(mtime, _get_digest(path), old_name)
+        changed = True
+
+    for path in [path for path in _watched if path not in paths]:
+        _remove_file(path)
+        changed = True
+    return changed
+
+
+def _poll() -> float:
+    if not preferences.get_preferences(bpy.context).authoring_mode:
+        _watched.clear()
+        return POLL_INTERVAL
+    if check_files():
+        utils.tag_view3d_redraw()
+    return POLL_INTERVAL
+
+
+def register():
+    bpy.app.timers.register(_poll, first_interval=POLL_INTERVAL, persistent=True)
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_poll):
+        bpy.app.timers.unregister(_poll)
+    _watched.clear()
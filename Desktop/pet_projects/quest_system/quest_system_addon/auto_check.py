@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks the unlocked steps automatically. Instead of polling, we listen to depsgraph updates for
+# data changes and to msgbus for UI state. A change only schedules a check if an unlocked step
+# depends on it, and bursts of changes (e.g. dragging a slider) are collapsed into one check
+# which runs after DEBOUNCE_INTERVAL of quiet.
+
+import bpy
+import time
+import typing
+import logging
+
+
+if "polib" not in locals():
+    import polib
+    from . import preferences
+    from . import loader
+    from . import logic
+    from . import test_cache
+    from . import background_check
+    from . import utils
+else:
+    import importlib
+    polib = importlib.reload(polib)
+    preferences = importlib.reload(preferences)
+    loader = importlib.reload(loader)
+    logic = importlib.reload(logic)
+    test_cache = importlib.reload(test_cache)
+    background_check = importlib.reload(background_check)
+    utils = importlib.reload(utils)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+telemetry = polib.get_telemetry("quest_system")
+
+
+DEBOUNCE_INTERVAL = 0.3
+# msgbus needs an owner object to unsubscribe
+MSGBUS_OWNER = object()
+MSGBUS_KEYS = {
+    loader.SHADING_DEPENDENCY: (bpy.types.View3DShading, "type"),
+}
+
+_last_change_time = 0.0
+_check_scheduled = False
+
+
+def _is_enabled() -> bool:
+    return preferences.get_preferences(bpy.context).auto_check
+
+
+def _is_relevant_change(
+    step_data: loader.Step,
+    depsgraph: typing.Optional[bpy.types.Depsgraph],
+    ui_dependency: typing.Optional[str]
+) -> bool:
+    if step_data.depends_on is None:
+        return True
+    if ui_dependency is not None:
+        return ui_dependency in step_data.depends_on
+    if depsgraph is None:
+        return True
+    for id_type in step_data.depends_on:
+        if id_type in MSGBUS_KEYS:
+            continue
+        if depsgraph.id_type_updated(id_type):
+            return True
+    return False
+
+
+def _run_check() -> typing.Optional[float]:
+    global _check_scheduled
+    remaining = DEBOUNCE_INTERVAL - (time.monotonic() - _last_change_time)
+    if remaining > 0.0:
+        return remaining
+
+    started = time.monotonic()
+    reschedule = False
+    try:
+        if _is_enabled():
+            postponed = _check_frontier()
+            # Completed steps could have unlocked steps the learner already did, schedule_check
+            # called meanwhile only moved _last_change_time as this timer is still registered
+            reschedule = postponed or _last_change_time >= started
+    except Exception:
+        # Blender unregisters timers which raise, the next change has to schedule a new one
+        logger.exception("Automatic check failed")
+    finally:
+        if not reschedule:
+            _check_scheduled = False
+    return DEBOUNCE_INTERVAL if reschedule else None
+
+
+def _check_frontier() -> bool:
+    """Checks the unlocked steps, returns whether some were postponed"""
+    prefs = preferences.get_preferences(bpy.context)
+    postponed = False
+    # Only the frontier is checked, locked and completed steps never are
+    for step_data in logic.get_frontier_steps(prefs):
+        if background_check.is_checking(step_data.id):
+            # Expensive tests of the step are still being evaluated, don't queue more work behind
+            # them, the step is checked again once they finish
+            postponed = True
+            continue
+        on_done = _make_on_done(step_data)
+        passed = logic.check_step_in_background(step_data, on_done)
+        if passed is not None:
+            on_done(passed)
+    return postponed
+
+
+def _make_on_done(step_data: loader.Step) -> typing.Callable[[bool], None]:
+    def on_done(passed: bool) -> None:
+        prefs = preferences.get_preferences(bpy.context)
+        if not passed or not logic.is_step_available(prefs, step_data.id):
+            return
+        if len(logic.complete_step(prefs, step_data)) > 0:
+            # The learner could have already done what the unlocked steps ask for
+            schedule_check()
+        utils.tag_view3d_redraw()
+    return on_done
+
+
+def schedule_check() -> None:
+    global _last_change_time
+    global _check_scheduled
+    _last_change_time = time.monotonic()
+    if _check_scheduled:
+        return
+    _check_scheduled = True
+    bpy.app.timers.register(_run_check, first_interval=DEBOUNCE_INTERVAL)
+
+
+def _on_change(
+    depsgraph: typing.Optional[bpy.types.Depsgraph] = None,
+    ui_dependency: typing.Optional[str] = None
+) -> None:
+    if not _is_enabled():
+        return
+    for step_data in logic.get_frontier_steps(preferences.get_preferences(bpy.context)):
+        if _is_relevant_change(step_data, depsgraph, ui_dependency):
+            schedule_check()
+            return
+
+
+def _on_ui_change(dependency: str) -> None:
+    test_cache.bump(dependency)
+    _on_change(ui_dependency=dependency)
+
+
+@bpy.app.handlers.persistent
+def _depsgraph_update_post(scene: bpy.types.Scene, depsgraph: typing.Optional[bpy.types.Depsgraph] = None) -> None:
+    if depsgraph is not None:
+        test_cache.record_depsgraph_update(depsgraph)
+    else:
+        test_cache.bump_all()
+    _on_change(depsgraph=depsgraph)
+
+
+def _subscribe_msgbus() -> None:
+    for dependency, key in MSGBUS_KEYS.items():
+        bpy.msgbus.subscribe_rna(
+            key=key,
+            owner=MSGBUS_OWNER,
+            args=(dependency,),
+            notify=_on_ui_change
+        )
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    global _check_scheduled
+    # Loading a file drops the non-persistent check timer
+    if bpy.app.timers.is_registered(_run_check):
+        bpy.app.timers.unregister(_run_check)
+    _check_scheduled = False
+    test_cache.bump_all()
+    # Subscriptions are cleared when a file is loaded
+    bpy.msgbus.clear_by_owner(MSGBUS_OWNER)
+    _subscribe_msgbus()
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(_depsgraph_update_post)
+    bpy.app.handlers.load_post.append(_load_post)
+    _subscribe_msgbus()
+
+
+def unregister():
+    global _check_scheduled
+    bpy.msgbus.clear_by_owner(MSGBUS_OWNER)
+    if bpy.app.timers.is_registered(_run_check):
+        bpy.app.timers.unregister(_run_check)
+    _check_scheduled = False
+    bpy.app.handlers.load_post.remove(_load_post)
+    bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_update_post)
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Evaluation of expensive step tests outside of the UI thread. Geometry comparisons on production
+# assets take seconds, so such tests are split in two: 'snapshot' copies what the test needs out
+# of bpy (e.g. vertex buffers as numpy arrays) on the main thread, 'evaluate' does the heavy work
+# on the snapshot in a worker thread. bpy must never be touched from the workers. Results are
+# collected by a timer on the main thread, the panel shows the step as being checked meanwhile.
+
+import bpy
+import time
+import typing
+import logging
+import concurrent.futures
+
+
+if "polib" not in locals():
+    import polib
+    from . import profiling
+    from . import utils
+else:
+    import importlib
+    polib = importlib.reload(polib)
+    profiling = importlib.reload(profiling)
+    utils = importlib.reload(utils)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+TestLambda = typing.Callable[[], bool]
+SnapshotLambda = typing.Callable[[], typing.Any]
+EvaluateLambda = typing.Callable[[typing.Any], bool]
+
+
+MAX_WORKERS = 2
+POLL_INTERVAL = 0.05
+
+
+def expensive_test(snapshot: SnapshotLambda, evaluate: EvaluateLambda) -> TestLambda:
+    """Creates a test which can be evaluated in a worker thread.
+
+    'snapshot' runs on the main thread and returns data for 'evaluate', or None if the test fails
+    right away (e.g. the object doesn't exist). 'evaluate' must not access bpy. Called directly,
+    the test evaluates synchronously.
+    """
+    def test() -> bool:
+        data = snapshot()
+        return data is not None and bool(evaluate(data))
+
+    test.snapshot = snapshot
+    test.evaluate = evaluate
+    return test
+
+
+def is_expensive(test: TestLambda) -> bool:
+    return getattr(test, "snapshot", None) is not None
+
+
+class Job:
+    """Expensive test submitted to the pool"""
+
+    def __init__(
+        self,
+        name: str,
+        test: TestLambda,
+        key: typing.Optional[typing.Tuple[int, ...]],
+        future: concurrent.futures.Future,
+        snapshot_time: float
+    ) -> None:
+        # Name of the test in profiling data
+        self.name = name
+        self.test = test
+        # Version key the result is memoized under
+        self.key = key
+        self.future = future
+        self.start = time.perf_counter() - snapshot_time
+
+
+class PendingCheck:
+    def __init__(self, step_id: str, on_done: typing.Callable[[bool], None]) -> None:
+        self.step_id = step_id
+        self.on_done = on_done
+        self.jobs: typing.List[Job] = []
+
+
+_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+# Pending checks by step id, all unlocked steps can be checked at the same time
+_pending: typing.Dict[str, PendingCheck] = {}
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix="quest_system_check")
+    return _executor
+
+
+def submit(name: str, test: TestLambda, key: typing.Optional[typing.Tuple[int, ...]]) -> typing.Optional[Job]:
+    """Takes a snapshot for 'test' and submits its evaluation, None if the test failed right away"""
+    start = time.perf_counter()
+    data = test.snapshot()
+    if data is None:
+        profiling.record(name, time.perf_counter() - start, False)
+        return None
+    future = _get_executor().submit(test.evaluate, data)
+    return Job(name, test, key, future, time.perf_counter() - start)
+
+
+def start_check(step_id: str, jobs: typing.List[Job], on_done: typing.Callable[[bool], None]) -> None:
+    """Waits for 'jobs' in a timer, 'on_done' is called with the result on the main thread.
+
+    A check of the same step started earlier is abandoned, its 'on_done' is never called.
+    """
+    cancel(step_id)
+    pending = _pending[step_id] = PendingCheck(step_id, on_done)
+    pending.jobs = jobs
+    if not bpy.app.timers.is_registered(_collect):
+        bpy.app.timers.register(_collect, first_interval=POLL_INTERVAL)
+    utils.tag_view3d_redraw()
+
+
+def is_checking(step_id: typing.Optional[str] = None) -> bool:
+    if step_id is None:
+        return len(_pending) > 0
+    return step_id in _pending
+
+
+def _get_job_result(job: Job) -> bool:
+    exception = job.future.exception()
+    if exception is not None:
+        logger.error(f"Test '{job.name}' failed to evaluate: {exception!r}")
+        return False
+    return bool(job.future.result())
+
+
+def _collect() -> typing.Optional[float]:
+    for step_id, pending in list(_pending.items()):
+        # 'on_done' of a previous check could have replaced or cancelled this one
+        if _pending.get(step_id, None) is pending:
+            _collect_check(pending)
+    return POLL_INTERVAL if len(_pending) > 0 else None
+
+
+def _collect_check(pending: PendingCheck) -> None:
+    results = [_get_job_result(job) for job in pending.jobs if job.future.done()]
+    passed = all(results)
+    # The step fails as soon as any test fails, no need to wait for the rest
+    if passed and len(results) < len(pending.jobs):
+        return
+
+    del _pending[pending.step_id]
+    for job in pending.jobs:
+        if not job.future.done():
+            job.future.cancel()
+            continue
+        result = _get_job_result(job)
+        profiling.record(job.name, time.perf_counter() - job.start, result)
+        store_result = getattr(job.test, "store_result", None)
+        if store_result is not None:
+            store_result(job.key, result)
+
+    pending.on_done(passed)
+    utils.tag_view3d_redraw()
+
+
+def cancel(step_id: typing.Optional[str] = None) -> None:
+    """Abandons the check of step with 'step_id', None abandons all checks"""
+    step_ids = list(_pending) if step_id is None else [step_id]
+    for step_id in step_ids:
+        pending = _pending.pop(step_id, None)
+        if pending is None:
+            continue
+        for job in pending.jobs:
+            # Jobs already running can't be stopped, their results are ignored
+            job.future.cancel()
+    if len(_pending) == 0 and bpy.app.timers.is_registered(_collect):
+        bpy.app.timers.unregister(_collect)
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    # Loading a file drops the non-persistent _collect timer, pending checks would never finish.
+    # Steps of the new file are checked again anyway.
+    cancel()
+
+
+def register():
+    bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    global _executor
+    bpy.app.handlers.load_post.remove(_load_post)
+    cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,394 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Quest packs are directories of JSON files, one task per file. Parsing every file on startup
+# doesn't scale to hundreds of quests, so the metadata of all tasks is compiled into a single
+# catalog file which is the only thing read on startup. Steps are read from the task file when
+# the task is used for the first time.
+#
+# This module doesn't depend on bpy, the catalog can be compiled from command line:
+#   python catalog.py [QUESTS_PATH]
+
+import os
+import re
+import sys
+import json
+import typing
+import logging
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+QUESTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quests")
+CATALOG_FILENAME = "catalog.json"
+CATALOG_FORMAT_VERSION = 3
+QUEST_FILE_EXTENSION = ".json"
+# Keys of a task file which are stored in the catalog, everything else is loaded lazily
+METADATA_KEYS = ("id", "name", "description", "difficulty")
+
+
+class QuestPackError(Exception):
+    pass
+
+
+class CatalogEntry:
+    __slots__ = ("id", "name", "description", "difficulty", "path", "mtime", "asset_libraries", "step_terms")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        description: str,
+        difficulty: str,
+        path: str,
+        mtime: float,
+        asset_libraries: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
+        step_terms: typing.Optional[typing.List[str]] = None
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.description = description
+        self.difficulty = difficulty
+        # Absolute path of the task file
+        self.path = path
+        self.mtime = mtime
+        # Stored in the catalog too, so libraries can be prefetched before the task file is read.
+        # Validated by read_asset_libraries.
+        self.asset_libraries = asset_libraries if asset_libraries is not None else []
+        # Words of step names and descriptions, tasks are searched by them without reading the file
+        self.step_terms = step_terms if step_terms is not None else []
+
+    def to_dict(self, quests_path: str) -> typing.Dict[str, typing.Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "difficulty": self.difficulty,
+            "file": os.path.relpath(self.path, quests_path),
+            "mtime": self.mtime,
+            "asset_libraries": self.asset_libraries,
+            "step_terms": self.step_terms,
+        }
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any], quests_path: str) -> 'CatalogEntry':
+        return cls(
+            data["id"],
+            data["name"],
+            data["description"],
+            data["difficulty"],
+            os.path.join(quests_path, data["file"]),
+            data["mtime"],
+            data.get("asset_libraries", []),
+            data.get("step_terms", [])
+        )
+
+    def read_task_data(self) -> typing.Dict[str, typing.Any]:
+        return read_task_file(self.path)
+
+
+class Catalog:
+    """Index of tasks by name and by difficulty.
+
+    Items are any objects with 'id', 'name' and 'difficulty' attributes, loader stores its Task
+    objects. 'search_index' (see search.py) is kept up to date with the items if given.
+    """
+
+    def __init__(self, search_index: typing.Optional[typing.Any] = None) -> None:
+        self.items_by_name: typing.Dict[str, typing.Any] = {}
+        self.items_by_id: typing.Dict[str, typing.Any] = {}
+        self.names_by_difficulty: typing.Dict[str, typing.List[str]] = {}
+        # Index of the name in its list in names_by_difficulty
+        self.positions_by_name: typing.Dict[str, int] = {}
+        self.search_index = search_index
+        # Bumped on every change, so anything derived from the catalog knows when to invalidate
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.items_by_name)
+
+    def __iter__(self) -> typing.Iterator[typing.Any]:
+        return iter(self.items_by_name.values())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.items_by_name
+
+    def get_id_conflict(self, item: typing.Any, replaced_name: typing.Optional[str] = None) -> typing.Optional[typing.Any]:
+        """Returns the item with the id of 'item' which wouldn't be replaced by adding 'item'"""
+        owner = self.items_by_id.get(item.id, None)
+        if owner is None or owner.name in (item.name, replaced_name):
+            return None
+        return owner
+
+    def _ensure_id_available(self, item: typing.Any, replaced_name: typing.Optional[str] = None) -> None:
+        owner = self.get_id_conflict(item, replaced_name)
+        if owner is not None:
+            raise QuestPackError(f"Task '{item.name}' has the same id '{item.id}' as task '{owner.name}'")
+
+    def add(self, item: typing.Any) -> None:
+        """Adds 'item', an item with the same name is replaced, one with the same id is an error"""
+        self._ensure_id_available(item)
+        if item.name in self.items_by_name:
+            self.remove(item.name)
+        self.items_by_name[item.name] = item
+        self.items_by_id[item.id] = item
+        names = self.names_by_difficulty.setdefault(item.difficulty, [])
+        self.positions_by_name[item.name] = len(names)
+        names.append(item.name)
+        if self.search_index is not None:
+            self.search_index.add(item)
+        self.version += 1
+
+    def replace(self, name: str, item: typing.Any) -> None:
+        """Replaces item 'name' by 'item', which keeps its position if the difficulty didn't change"""
+        self._ensure_id_available(item, name)
+        old_item = self.items_by_name.get(name, None)
+        if old_item is None or old_item.difficulty != item.difficulty or \
+                (item.name != name and item.name in self.items_by_name):
+            self.remove(name)
+            self.add(item)
+            return
+        if item.name != name:
+            del self.items_by_name[name]
+        del self.items_by_id[old_item.id]
+        self.items_by_name[item.name] = item
+        self.items_by_id[item.id] = item
+        position = self.positions_by_name.pop(name)
+        self.names_by_difficulty[item.difficulty][position] = item.name
+        self.positions_by_name[item.name] = position
+        if self.search_index is not None:
+            self.search_index.remove(name)
+            self.search_index.add(item)
+        self.version += 1
+
+    def remove(self, name: str) -> typing.Optional[typing.Any]:
+        item = self.items_by_name.pop(name, None)
+        if item is None:
+            return None
+        del self.items_by_id[item.id]
+        position = self.positions_by_name.pop(name)
+        names = self.names_by_difficulty[item.difficulty]
+        del names[position]
+        # Removing is rare (authoring mode), only names after the removed one move
+        for i in range(position, len(names)):
+            self.positions_by_name[names[i]] = i
+        if self.search_index is not None:
+            self.search_index.remove(name)
+        self.version += 1
+        return item
+
+    def get(self, name: str) -> typing.Optional[typing.Any]:
+        return self.items_by_name.get(name, None)
+
+    def get_by_id(self, id: str) -> typing.Optional[typing.Any]:
+        return self.items_by_id.get(id, None)
+
+    def get_names(self, difficulty: str) -> typing.List[str]:
+        return self.names_by_difficulty.get(difficulty, [])
+
+    def get_next(self, name: str) -> typing.Optional[typing.Any]:
+        """Returns the task listed after 'name' with the same difficulty, the likely next one"""
+        item = self.items_by_name.get(name, None)
+        if item is None:
+            return None
+        names = self.names_by_difficulty[item.difficulty]
+        index = self.positions_by_name[name]
+        return self.items_by_name[names[index + 1]] if index + 1 < len(names) else None
+
+
+def read_task_file(path: str) -> typing.Dict[str, typing.Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise QuestPackError(f"Couldn't read quest file '{path}': {e}") from e
+
+    missing_keys = [key for key in METADATA_KEYS if key not in data]
+    if len(missing_keys) > 0:
+        raise QuestPackError(f"Quest file '{path}' is missing keys: {', '.join(missing_keys)}")
+    return data
+
+
+def read_asset_libraries(data: typing.Dict[str, typing.Any], path: str) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Returns normalized "asset_libraries" of a task file.
+
+    Each library is {"file": path relative to quests, "collections": [names to link]}.
+    """
+    libraries = []
+    for spec in data.get("asset_libraries", []):
+        if isinstance(spec, str):
+            spec = {"file": spec}
+        if not isinstance(spec, dict) or not isinstance(spec.get("file", None), str):
+            raise QuestPackError(f"Quest file '{path}' has an asset library without 'file': {spec!r}")
+        collections = spec.get("collections", [])
+        if not isinstance(collections, list) or not all(isinstance(name, str) for name in collections):
+            raise QuestPackError(f"Collections of asset library '{spec['file']}' in '{path}' aren't a list of names")
+        libraries.append({"file": spec["file"], "collections": collections})
+    return libraries
+
+
+def list_task_files(quests_path: str) -> typing.Iterator[str]:
+    for dirpath, dirnames, filenames in os.walk(quests_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(QUEST_FILE_EXTENSION) or filename == CATALOG_FILENAME:
+                continue
+            yield os.path.join(dirpath, filename)
+
+
+def tokenize(text: str) -> typing.List[str]:
+    """Splits 'text' into lowercase words, used for both indexed text and search queries"""
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def read_step_terms(data: typing.Dict[str, typing.Any], path: str) -> typing.List[str]:
+    steps = data.get("steps", [])
+    if not isinstance(steps, list):
+        raise QuestPackError(f"Steps in '{path}' aren't a list")
+    terms = set()
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise QuestPackError(f"Step {i} in '{path}' isn't an object")
+        terms.update(tokenize(str(step.get("name", ""))))
+        terms.update(tokenize(str(step.get("description", ""))))
+    return sorted(terms)
+
+
+def read_catalog_entry(path: str) -> CatalogEntry:
+    data = read_task_file(path)
+    return CatalogEntry(
+        data["id"],
+        data["name"],
+        data["description"],
+        data["difficulty"],
+        path,
+        os.path.getmtime(path),
+        read_asset_libraries(data, path),
+        read_step_terms(data, path)
+    )
+
+
+def build_catalog_entries(
+    quests_path: str,
+    skipped: typing.Optional[typing.Dict[str, float]] = None
+) -> typing.List[CatalogEntry]:
+    """Reads all task files, invalid ones are logged and their mtimes stored in 'skipped'"""
+    entries = []
+    # Progress records refer to tasks by id, it has to be unique
+    paths_by_id: typing.Dict[str, str] = {}
+    for path in list_task_files(quests_path):
+        try:
+            entry = read_catalog_entry(path)
+            if entry.id in paths_by_id:
+                raise QuestPackError(f"Quest file '{path}' has the same id '{entry.id}' as '{paths_by_id[entry.id]}'")
+            paths_by_id[entry.id] = path
+            entries.append(entry)
+        except QuestPackError as e:
+            logger.error(f"Skipping quest: {e}")
+            if skipped is not None:
+                try:
+                    skipped[path] = os.path.getmtime(path)
+                except OSError:
+                    pass
+    return entries
+
+
+def write_catalog(
+    quests_path: str,
+    entries: typing.Iterable[CatalogEntry],
+    skipped: typing.Optional[typing.Dict[str, float]] = None
+) -> bool:
+    data = {
+        "version": CATALOG_FORMAT_VERSION,
+        "tasks": [entry.to_dict(quests_path) for entry in entries],
+        # Invalid files are part of the catalog state too, or one would keep it stale forever
+        "skipped": {
+            os.path.relpath(path, quests_path): mtime for path, mtime in (skipped or {}).items()
+        }
+    }
+    try:
+        with open(os.path.join(quests_path, CATALOG_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+    except OSError as e:
+        logger.warning(f"Couldn't write quest catalog to '{quests_path}': {e}")
+        return False
+    return True
+
+
+def _read_catalog(
+    quests_path: str
+) -> typing.Optional[typing.Tuple[typing.List[CatalogEntry], typing.Dict[str, float]]]:
+    """Returns entries and mtimes of skipped files by path stored in the catalog file"""
+    try:
+        with open(os.path.join(quests_path, CATALOG_FILENAME), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if data.get("version", None) != CATALOG_FORMAT_VERSION:
+        return None
+    try:
+        entries = [CatalogEntry.from_dict(task, quests_path) for task in data["tasks"]]
+        skipped = {os.path.join(quests_path, path): mtime for path, mtime in data.get("skipped", {}).items()}
+    except (KeyError, AttributeError):
+        return None
+    return entries, skipped
+
+
+def _is_catalog_up_to_date(
+    quests_path: str,
+    entries: typing.List[CatalogEntry],
+    skipped: typing.Dict[str, float]
+) -> bool:
+    # Stats are cheap compared to parsing all the task files
+    mtimes = dict(skipped)
+    mtimes.update((entry.path, entry.mtime) for entry in entries)
+    try:
+        return mtimes == {path: os.path.getmtime(path) for path in list_task_files(quests_path)}
+    except OSError:
+        return False
+
+
+def load_catalog_entries(quests_path: str = QUESTS_PATH) -> typing.List[CatalogEntry]:
+    """Returns metadata of all tasks in 'quests_path', recompiles the catalog file if it is stale"""
+    if not os.path.isdir(quests_path):
+        return []
+
+    catalog_data = _read_catalog(quests_path)
+    if catalog_data is not None and _is_catalog_up_to_date(quests_path, *catalog_data):
+        return catalog_data[0]
+
+    logger.info(f"Quest catalog in '{quests_path}' is missing or stale, rebuilding")
+    skipped: typing.Dict[str, float] = {}
+    entries = build_catalog_entries(quests_path, skipped)
+    write_catalog(quests_path, entries, skipped)
+    return entries
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    path = sys.argv[1] if len(sys.argv) > 1 else QUESTS_PATH
+    skipped_files: typing.Dict[str, float] = {}
+    compiled_entries = build_catalog_entries(path, skipped_files)
+    if not write_catalog(path, compiled_entries, skipped_files):
+        sys.exit(1)
+    print(f"Compiled {len(compiled_entries)} quest(s) into '{os.path.join(path, CATALOG_FILENAME)}'")
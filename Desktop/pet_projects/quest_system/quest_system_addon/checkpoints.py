@@ -0,0 +1,346 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checkpoints taken when the task starts and whenever a step is passed, so the learner can rewind
+# to any passed step without restarting the task. A checkpoint is a small .blend in a temporary
+# directory holding only datablocks the depsgraph reported as changed since the previous
+# checkpoint, plus names of all datablocks existing at that time. Every KEYFRAME_INTERVAL-th
+# checkpoint is full, rewinding only needs the checkpoints since the last full one. When the
+# checkpoints take more than MAX_TOTAL_BYTES or MAX_CHECKPOINTS, the oldest ones up to the next
+# full checkpoint are evicted.
+#
+# Rewinding removes datablocks created after the checkpoint, appends the checkpointed version
+# of datablocks changed or removed since and remaps their users. Scenes and collections are not
+# checkpointed, objects removed since are linked back to the collections they were in.
+
+import os
+import bpy
+import time
+import shutil
+import typing
+import logging
+import tempfile
+
+
+if "sandbox" not in locals():
+    from . import sandbox
+    from . import profiling
+    from . import test_cache
+else:
+    import importlib
+    sandbox = importlib.reload(sandbox)
+    profiling = importlib.reload(profiling)
+    test_cache = importlib.reload(test_cache)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+# bpy.data collections of checkpointed datablocks by the type of their datablocks
+CHECKPOINT_TYPES = (
+    ("Object", "objects"),
+    ("Mesh", "meshes"),
+    ("Curve", "curves"),
+    ("Material", "materials"),
+    ("NodeTree", "node_groups"),
+    ("Light", "lights"),
+    ("Camera", "cameras"),
+    ("World", "worlds"),
+    ("Texture", "textures"),
+    ("Image", "images"),
+)
+CHECKPOINT_COLLECTIONS = tuple(collection_name for _, collection_name in CHECKPOINT_TYPES)
+KEYFRAME_INTERVAL = 8
+MAX_CHECKPOINTS = 64
+MAX_TOTAL_BYTES = 256 * 2**20
+# Stands for the master collection of the scene in Checkpoint.object_collections
+SCENE_COLLECTION = ""
+
+
+# (bpy.data collection name, datablock name)
+DatablockKey = typing.Tuple[str, str]
+
+
+class Checkpoint:
+    def __init__(self, step_id: typing.Optional[str], completed_steps: typing.Iterable[str], is_full: bool) -> None:
+        # Step passed when the checkpoint was taken, None for the start of the task
+        self.step_id = step_id
+        self.completed_steps = tuple(completed_steps)
+        self.is_full = is_full
+        # None if nothing changed since the previous checkpoint
+        self.path: typing.Optional[str] = None
+        self.size = 0
+        # Datablocks stored in the file, their dependencies are stored too but aren't listed
+        self.stored: typing.Set[DatablockKey] = set()
+        # All datablocks existing when the checkpoint was taken
+        self.inventory: typing.Set[DatablockKey] = set()
+        self.object_collections: typing.Dict[str, typing.List[str]] = {}
+
+
+_directory: typing.Optional[str] = None
+_checkpoints: typing.List[Checkpoint] = []
+# Datablocks changed since the last checkpoint
+_dirty: typing.Set[DatablockKey] = set()
+_file_counter = 0
+_force_full = False
+
+
+def _get_directory() -> str:
+    global _directory
+    if _directory is None:
+        _directory = tempfile.mkdtemp(prefix="quest_system_checkpoints_")
+    return _directory
+
+
+def _get_key(datablock: bpy.types.ID) -> typing.Optional[DatablockKey]:
+    # Node trees of materials and worlds are embedded, their owner is updated with them
+    if getattr(datablock, "is_embedded_data", False):
+        return None
+    for type_name, collection_name in CHECKPOINT_TYPES:
+        if isinstance(datablock, getattr(bpy.types, type_name)):
+            return (collection_name, datablock.name)
+    return None
+
+
+def _iter_checkpointed() -> typing.Iterator[typing.Tuple[DatablockKey, bpy.types.ID]]:
+    for collection_name in CHECKPOINT_COLLECTIONS:
+        for datablock in getattr(bpy.data, collection_name):
+            if datablock.library is None and not sandbox.is_protected(datablock):
+                yield (collection_name, datablock.name), datablock
+
+
+def _get_object_collections(obj: bpy.types.Object) -> typing.List[str]:
+    scene_collection = bpy.context.scene.collection
+    return [
+        SCENE_COLLECTION if collection == scene_collection else collection.name
+        for collection in obj.users_collection
+    ]
+
+
+def _delete_files(checkpoints: typing.Iterable[Checkpoint]) -> None:
+    for checkpoint in checkpoints:
+        if checkpoint.path is not None and os.path.isfile(checkpoint.path):
+            os.remove(checkpoint.path)
+
+
+def _evict() -> None:
+    global _force_full
+    total_size = sum(checkpoint.size for checkpoint in _checkpoints)
+    while len(_checkpoints) > MAX_CHECKPOINTS or total_size > MAX_TOTAL_BYTES:
+        # Checkpoints can only be evicted together with all deltas depending on them
+        next_full = next((i for i in range(1, len(_checkpoints)) if _checkpoints[i].is_full), None)
+        if next_full is None:
+            # Next checkpoint starts a new segment which lets us evict this one
+            _force_full = True
+            return
+        evicted = _checkpoints[:next_full]
+        del _checkpoints[:next_full]
+        _delete_files(evicted)
+        total_size -= sum(checkpoint.size for checkpoint in evicted)
+        logger.info(f"Evicted {len(evicted)} checkpoints, {total_size / 2**20:.1f} MiB left")
+
+
+def reset() -> None:
+    """Drops all checkpoints, called when a task (re)starts"""
+    global _force_full
+    _delete_files(_checkpoints)
+    _checkpoints.clear()
+    _dirty.clear()
+    _force_full = False
+
+
+def create(step_id: typing.Optional[str], completed_steps: typing.Iterable[str]) -> Checkpoint:
+    """Takes a checkpoint of the current state, 'completed_steps' are restored by rewinding to it"""
+    global _file_counter, _force_full
+    start = time.perf_counter()
+    since_full = next(
+        (i for i, checkpoint in enumerate(reversed(_checkpoints)) if checkpoint.is_full), len(_checkpoints))
+    is_full = _force_full or len(_checkpoints) == 0 or since_full + 1 >= KEYFRAME_INTERVAL
+    checkpoint = Checkpoint(step_id, completed_steps, is_full)
+
+    datablocks = set()
+    for key, datablock in _iter_checkpointed():
+        checkpoint.inventory.add(key)
+        if is_full or key in _dirty:
+            checkpoint.stored.add(key)
+            datablocks.add(datablock)
+        if key[0] == "objects":
+            checkpoint.object_collections[key[1]] = _get_object_collections(datablock)
+
+    if len(datablocks) > 0:
+        _file_counter += 1
+        checkpoint.path = os.path.join(_get_directory(), f"checkpoint_{_file_counter}.blend")
+        bpy.data.libraries.write(checkpoint.path, datablocks, path_remap='ABSOLUTE', compress=True)
+        checkpoint.size = os.path.getsize(checkpoint.path)
+
+    _checkpoints.append(checkpoint)
+    _dirty.clear()
+    _force_full = False
+    _evict()
+    profiling.record("checkpoint:create", time.perf_counter() - start)
+    return checkpoint
+
+
+def find(step_id: typing.Optional[str]) -> typing.Optional[int]:
+    """Returns index of the latest checkpoint taken when 'step_id' was passed"""
+    for i in range(len(_checkpoints) - 1, -1, -1):
+        if _checkpoints[i].step_id == step_id:
+            return i
+    return None
+
+
+def has_checkpoint(step_id: typing.Optional[str]) -> bool:
+    return find(step_id) is not None
+
+
+def _load(checkpoint: Checkpoint) -> typing.List[typing.Tuple[DatablockKey, bpy.types.ID]]:
+    """Appends all checkpointed datablocks in the file of 'checkpoint'"""
+    requested: typing.Dict[str, typing.List[str]] = {}
+    with bpy.data.libraries.load(checkpoint.path, link=False) as (data_from, data_to):
+        for collection_name in CHECKPOINT_COLLECTIONS:
+            # Dependencies are requested explicitly too, otherwise we couldn't tell their names
+            requested[collection_name] = list(getattr(data_from, collection_name))
+            setattr(data_to, collection_name, requested[collection_name])
+
+    appended = []
+    for collection_name, names in requested.items():
+        for name, datablock in zip(names, getattr(data_to, collection_name)):
+            if datablock is not None:
+                appended.append(((collection_name, name), datablock))
+    return appended
+
+
+def rewind(step_id: typing.Optional[str]) -> typing.Optional[typing.Tuple[str, ...]]:
+    """Restores the checkpoint taken when 'step_id' was passed, None for the start of the task.
+
+    Returns ids of steps completed at that time, None if there is no such checkpoint.
+    """
+    index = find(step_id)
+    if index is None:
+        return None
+
+    start = time.perf_counter()
+    target = _checkpoints[index]
+    segment_start = max(i for i in range(index + 1) if _checkpoints[i].is_full)
+    changed = set(_dirty)
+    for checkpoint in _checkpoints[index + 1:]:
+        changed.update(checkpoint.stored)
+
+    current = dict(_iter_checkpointed())
+    created = [datablock for key, datablock in current.items() if key not in target.inventory]
+    if len(created) > 0:
+        bpy.data.batch_remove(ids=created)
+    removed = target.inventory.difference(current)
+    needed = changed.intersection(target.inventory) | removed
+
+    # Latest version of each needed datablock not newer than the target
+    sources: typing.Dict[int, typing.Set[DatablockKey]] = {}
+    for key in needed:
+        source = next((i for i in range(index, segment_start - 1, -1) if key in _checkpoints[i].stored), None)
+        if source is None:
+            logger.warning(f"Checkpoint of '{key[1]}' from bpy.data.{key[0]} is missing")
+            continue
+        sources.setdefault(source, set()).add(key)
+
+    replacements = []
+    discarded = []
+    for source, keys in sources.items():
+        for key, datablock in _load(_checkpoints[source]):
+            if key in keys:
+                replacements.append((key, datablock))
+            else:
+                discarded.append((key, datablock))
+
+    outdated = []
+    for (collection_name, name), datablock in replacements:
+        existing = getattr(bpy.data, collection_name).get(name, None)
+        if existing is not None and existing != datablock:
+            existing.user_remap(datablock)
+            outdated.append(existing)
+    if len(outdated) > 0:
+        bpy.data.batch_remove(ids=outdated)
+
+    for (collection_name, name), datablock in replacements:
+        datablock.name = name
+        if collection_name == "objects" and len(datablock.users_collection) == 0:
+            _link_object(datablock, target.object_collections.get(name, [SCENE_COLLECTION]))
+
+    # Copies of unchanged datablocks came in as dependencies, users get the existing ones back
+    for (collection_name, name), datablock in discarded:
+        existing = getattr(bpy.data, collection_name).get(name, None)
+        if existing is not None and existing != datablock:
+            datablock.user_remap(existing)
+    if len(discarded) > 0:
+        bpy.data.batch_remove(ids=[datablock for _, datablock in discarded])
+    sandbox.purge_orphans()
+
+    evicted = _checkpoints[index + 1:]
+    del _checkpoints[index + 1:]
+    _delete_files(evicted)
+    _dirty.clear()
+    # Datablocks were replaced under the same names
+    test_cache.bump_all()
+    profiling.record("checkpoint:rewind", time.perf_counter() - start)
+    logger.info(
+        f"Rewound to checkpoint of step '{step_id}', removed {len(created)} and restored "
+        f"{len(replacements)} datablocks")
+    return target.completed_steps
+
+
+def _link_object(obj: bpy.types.Object, collection_names: typing.List[str]) -> None:
+    for collection_name in collection_names:
+        if collection_name == SCENE_COLLECTION:
+            collection = bpy.context.scene.collection
+        else:
+            collection = bpy.data.collections.get(collection_name, None)
+        if collection is not None:
+            collection.objects.link(obj)
+
+
+@bpy.app.handlers.persistent
+def _depsgraph_update_post(scene: bpy.types.Scene, depsgraph: typing.Optional[bpy.types.Depsgraph] = None) -> None:
+    if len(_checkpoints) == 0 or depsgraph is None:
+        return
+    for update in depsgraph.updates:
+        key = _get_key(update.id.original)
+        if key is not None:
+            _dirty.add(key)
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    # Checkpoints belong to the scene of the previous file
+    reset()
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(_depsgraph_update_post)
+    bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    global _directory
+    bpy.app.handlers.load_post.remove(_load_post)
+    bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_update_post)
+    reset()
+    if _directory is not None:
+        shutil.rmtree(_directory, ignore_errors=True)
+        _directory = None
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Geometry predicates for step tests. Meshes of assets have hundreds of thousands of vertices, so
+# vertex data is always read in bulk with foreach_get and evaluated by vectorized numpy operations,
+# never by per-vertex Python loops. Displacement is measured against rest positions captured when
+# the task starts. They are stored in a hidden mesh too, so a task resumed after Blender restarted
+# still has them. Displacement tests are expensive tests, the arrays are snapshotted on the main
+# thread and compared in a worker. Arrays read here are never modified in place, so workers can
+# read them without copying.
+
+import bpy
+import numpy
+import typing
+import hashlib
+
+
+if "test_cache" not in locals():
+    from . import test_cache
+    from . import background_check
+else:
+    import importlib
+    test_cache = importlib.reload(test_cache)
+    background_check = importlib.reload(background_check)
+
+
+TestLambda = typing.Callable[[], bool]
+
+
+REST_MESH_PREFIX = ".quest_system_rest_"
+
+
+# Rest positions by (object name, evaluated), read from the stored mesh on first use
+_rest_coords: typing.Dict[typing.Tuple[str, bool], numpy.ndarray] = {}
+# Coordinates read in the current check cycle, shared by all predicates of the cycle
+_cycle_coords: typing.Dict[typing.Tuple[str, bool], numpy.ndarray] = {}
+_cycle_coords_id: typing.Optional[int] = None
+
+
+def read_vertex_coords(mesh: bpy.types.Mesh) -> numpy.ndarray:
+    coords = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+
+def read_object_coords(obj: bpy.types.Object, evaluated: bool = False) -> numpy.ndarray:
+    """Reads local vertex coordinates, 'evaluated' includes the effect of modifiers"""
+    if not evaluated:
+        return read_vertex_coords(obj.data)
+
+    obj_eval = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    mesh = obj_eval.to_mesh()
+    try:
+        return read_vertex_coords(mesh)
+    finally:
+        obj_eval.to_mesh_clear()
+
+
+def get_coords(object_name: str, evaluated: bool, cycle: typing.Optional[int] = None) -> typing.Optional[numpy.ndarray]:
+    global _cycle_coords_id
+    obj = bpy.data.objects.get(object_name, None)
+    if obj is None or obj.type != 'MESH':
+        return None
+    if cycle is None:
+        return read_object_coords(obj, evaluated)
+
+    if cycle != _cycle_coords_id:
+        _cycle_coords.clear()
+        _cycle_coords_id = cycle
+    key = (object_name, evaluated)
+    coords = _cycle_coords.get(key, None)
+    if coords is None:
+        coords = _cycle_coords[key] = read_object_coords(obj, evaluated)
+    return coords
+
+
+def _get_rest_mesh_name(object_name: str, evaluated: bool) -> str:
+    # Hashed, object names can be as long as the mesh name limit. The dot hides it in the UI.
+    digest = hashlib.sha1(object_name.encode("utf-8")).hexdigest()[:16]
+    return f"{REST_MESH_PREFIX}{digest}{'_evaluated' if evaluated else ''}"
+
+
+def capture_rest_coords(object_name: str, evaluated: bool) -> None:
+    coords = get_coords(object_name, evaluated)
+    mesh_name = _get_rest_mesh_name(object_name, evaluated)
+    stored_mesh = bpy.data.meshes.get(mesh_name, None)
+    if stored_mesh is not None:
+        bpy.data.meshes.remove(stored_mesh)
+    if coords is None:
+        _rest_coords.pop((object_name, evaluated), None)
+        return
+    _rest_coords[(object_name, evaluated)] = coords
+    # Saved with the file as vertices of a mesh nothing uses, so a task can be resumed in another
+    # session. Evaluated coordinates can have a different vertex count than the object's mesh.
+    stored_mesh = bpy.data.meshes.new(mesh_name)
+    stored_mesh.vertices.add(len(coords))
+    stored_mesh.vertices.foreach_set("co", coords.ravel())
+    stored_mesh.use_fake_user = True
+
+
+def get_rest_coords(object_name: str, evaluated: bool) -> typing.Optional[numpy.ndarray]:
+    key = (object_name, evaluated)
+    coords = _rest_coords.get(key, None)
+    if coords is not None:
+        return coords
+    stored_mesh = bpy.data.meshes.get(_get_rest_mesh_name(object_name, evaluated), None)
+    if stored_mesh is None:
+        return None
+    coords = _rest_coords[key] = read_vertex_coords(stored_mesh)
+    return coords
+
+
+def clear_rest_coords() -> None:
+    """Forgets rest positions read so far, the stored ones are read again when needed"""
+    _rest_coords.clear()
+    _cycle_coords.clear()
+
+
+def compute_displacement(coords: numpy.ndarray, rest_coords: numpy.ndarray) -> typing.Optional[numpy.ndarray]:
+    """Returns distance every vertex moved, None if the topology changed"""
+    if coords.shape != rest_coords.shape:
+        return None
+    delta = coords - rest_coords
+    return numpy.sqrt(numpy.einsum("ij,ij->i", delta, delta))
+
+
+def displaced_fraction(displacement: numpy.ndarray, threshold: float) -> float:
+    if len(displacement) == 0:
+        return 0.0
+    return numpy.count_nonzero(displacement > threshold) / len(displacement)
+
+
+def _make_displacement_test(
+    object_name: str,
+    evaluated: bool,
+    predicate: typing.Callable[[numpy.ndarray], bool]
+) -> TestLambda:
+    def snapshot() -> typing.Optional[typing.Tuple[numpy.ndarray, numpy.ndarray]]:
+        rest_coords = get_rest_coords(object_name, evaluated)
+        if rest_coords is None:
+            return None
+        coords = get_coords(object_name, evaluated, test_cache.get_cycle())
+        if coords is None:
+            return None
+        return coords, rest_coords
+
+    def evaluate(data: typing.Tuple[numpy.ndarray, numpy.ndarray]) -> bool:
+        displacement = compute_displacement(*data)
+        if displacement is None:
+            return False
+        return bool(predicate(displacement))
+
+    test = background_check.expensive_test(snapshot, evaluate)
+    test.on_task_start = lambda: capture_rest_coords(object_name, evaluated)
+    # Rest positions have to come from the freshly prepared scene, not from the learner's edits
+    test.captures_scene = True
+    return test
+
+
+def vertices_displaced(
+    object_name: str,
+    threshold: float,
+    min_fraction: float = 0.0,
+    evaluated: bool = True
+) -> TestLambda:
+    """More than 'min_fraction' of vertices moved further than 'threshold' since task start"""
+    return _make_displacement_test(
+        object_name, evaluated,
+        lambda displacement: displaced_fraction(displacement, threshold) > min_fraction)
+
+
+def bumps_applied(object_name: str, threshold: float, min_fraction: float = 0.0) -> TestLambda:
+    """Like vertices_displaced, but only counts deformation applied to the mesh data itself"""
+    return vertices_displaced(object_name, threshold, min_fraction, evaluated=False)
+
+
+def max_displacement_at_least(object_name: str, distance: float, evaluated: bool = True) -> TestLambda:
+    return _make_displacement_test(
+        object_name, evaluated, lambda displacement: displacement.size > 0 and displacement.max() >= distance)
+
+
+def mean_displacement_between(
+    object_name: str,
+    low: float,
+    high: float,
+    evaluated: bool = True
+) -> TestLambda:
+    return _make_displacement_test(
+        object_name, evaluated,
+        lambda displacement: displacement.size > 0 and low <= displacement.mean() <= high)
+
+
+def vertex_count_at_least(object_name: str, count: int, evaluated: bool = True) -> TestLambda:
+    def test() -> bool:
+        coords = get_coords(object_name, evaluated, test_cache.get_cycle())
+        return coords is not None and len(coords) >= count
+    return test
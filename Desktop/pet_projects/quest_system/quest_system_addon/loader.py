@@ -20,77 +20,289 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
+import re
+import sys
 import bpy
+import bmesh
 import typing
+import logging
 import itertools
 
 
 if "polib" not in locals():
     import polib
     from . import preferences
+    from . import catalog
+    from . import test_cache
+    from . import templates
+    from . import sandbox
+    from . import checkpoints
+    from . import assets
+    from . import profiling
+    from . import progress
+    from . import search
 else:
     import importlib
     polib = importlib.reload(polib)
     preferences = importlib.reload(preferences)
+    catalog = importlib.reload(catalog)
+    test_cache = importlib.reload(test_cache)
+    templates = importlib.reload(templates)
+    sandbox = importlib.reload(sandbox)
+    checkpoints = importlib.reload(checkpoints)
+    assets = importlib.reload(assets)
+    profiling = importlib.reload(profiling)
+    progress = importlib.reload(progress)
+    search = importlib.reload(search)
 
 
-STARTUP_FILES_PATH = "../startup_files/"
+STARTUP_FILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_files")
 
 
+logger = logging.getLogger(f"polygoniq.{__name__}")
 telemetry = polib.get_telemetry("quest_system")
 
 
 MODULE_CLASSES: typing.List[typing.Type] = []
 
 
-def clear_blend() -> None:
-    bpy.data.batch_remove(ids=itertools.chain(
-        bpy.data.objects,
-        bpy.data.collections,
-        bpy.data.materials,
-        bpy.data.meshes,
-        bpy.data.images,
-        bpy.data.particles)
-    )
+def import_test_library(name: str) -> typing.Any:
+    """Imports a module of this add-on the first time a quest needs it.
 
+    Test libraries pull numpy and friends in, importing them eagerly would slow Blender startup
+    down for every user, even if they never open a quest using them.
+    """
+    import importlib
+    return importlib.import_module(f"{__package__}.{name}")
 
-def mock_startup_blend() -> None:
-    clear_blend()
+
+def clear_blend() -> None:
+    bpy.data.batch_remove(ids=[
+        datablock for datablock in itertools.chain(
+            bpy.data.objects,
+            bpy.data.collections,
+            bpy.data.materials,
+            bpy.data.meshes,
+            bpy.data.images,
+            bpy.data.particles)
+        # Linked asset libraries are reused by the next task
+        if not templates.is_template_datablock(datablock) and datablock.library is None
+    ])
+    # Cameras, lights and other data of the removed objects
+    sandbox.purge_orphans()
+
+
+def _new_scene_collection() -> bpy.types.Collection:
     collection = bpy.data.collections.new("Collection")
     bpy.context.scene.collection.children.link(collection)
     layer_collection = bpy.context.view_layer.layer_collection.children[collection.name]
     bpy.context.view_layer.active_layer_collection = layer_collection
+    return collection
 
-    bpy.ops.object.camera_add(location=(7.359, -6.927, 4.958), rotation=(1.109, 0.0, 0.815))
-    bpy.ops.object.light_add(type='POINT', location=(4.076, 1.005, 5.904))
-    bpy.ops.mesh.primitive_cube_add()
+
+def mock_startup_blend() -> None:
+    # Built through bpy.data, operators would need a 3D viewport in context
+    clear_blend()
+    collection = _new_scene_collection()
+
+    camera = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    camera.location = (7.359, -6.927, 4.958)
+    camera.rotation_euler = (1.109, 0.0, 0.815)
+    collection.objects.link(camera)
+    bpy.context.scene.camera = camera
+
+    light = bpy.data.objects.new("Light", bpy.data.lights.new("Light", type='POINT'))
+    light.location = (4.076, 1.005, 5.904)
+    collection.objects.link(light)
+
+    mesh = bpy.data.meshes.new("Cube")
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=2.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    collection.objects.link(bpy.data.objects.new("Cube", mesh))
+
+
+def prepare_blend_from_template(filename: str) -> None:
+    path = os.path.join(STARTUP_FILES_PATH, filename)
+    if not os.path.isfile(path):
+        logger.warning(f"Startup file '{path}' doesn't exist, using default startup scene")
+        mock_startup_blend()
+        return
+
+    template = templates.get_template(path)
+    clear_blend()
+    collection = _new_scene_collection()
+    for obj in template.instantiate(collection):
+        if obj.type == 'CAMERA' and bpy.context.scene.camera is None:
+            bpy.context.scene.camera = obj
 
 
 PrepareBlendLambda = typing.Callable[[], None]
+SolutionLambda = typing.Callable[[], None]
 TestLambda = typing.Callable[[], bool]
 
 
+# Pseudo ID type for viewport shading, it isn't a datablock so changes come from msgbus
+SHADING_DEPENDENCY = 'SHADING'
+
+
+def depends_on(*id_types: str) -> typing.Callable[[TestLambda], TestLambda]:
+    """Declares which ID types (as in Depsgraph.id_type_updated) the decorated test reads.
+
+    The result of the test is cached until an ID of one of these types changes. Tests without
+    the declaration are rechecked after any change. Declaring dependencies also promises the test
+    doesn't change the scene, so it can be evaluated in any order with other such tests.
+    """
+    def decorator(test: TestLambda) -> TestLambda:
+        memoized = test_cache.memoize(test, frozenset(id_types))
+        memoized.reorderable = True
+        return memoized
+    return decorator
+
+
 class Step:
-    def __init__(self, name: str, description: str, tests: typing.List[TestLambda]) -> None:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        tests: typing.List[TestLambda],
+        solution: typing.Optional[SolutionLambda] = None,
+        id: typing.Optional[str] = None,
+        requires: typing.Optional[typing.Iterable[str]] = None
+    ) -> None:
+        # Unique within the task, assigned by the task if not given
+        self.id = id
+        # Ids of steps which have to be completed before this one is unlocked. None means the
+        # previous step of the task, so tasks without 'requires' are linear.
+        self.requires: typing.Optional[typing.Tuple[str, ...]] = \
+            tuple(requires) if requires is not None else None
         self.name = name
         self.description = description
         self.tests = tests
+        # Names of tests in profiling data
+        self.test_labels = [getattr(test, "label", test.__name__) for test in tests]
+        # Reference solution, only used for validation of quests
+        self.solution = solution
+        self.depends_on = self._gather_dependencies(tests)
+
+    @staticmethod
+    def _gather_dependencies(tests: typing.List[TestLambda]) -> typing.Optional[typing.FrozenSet[str]]:
+        dependencies = set()
+        for test in tests:
+            test_dependencies = getattr(test, "depends_on", None)
+            if test_dependencies is None:
+                return None
+            dependencies.update(test_dependencies)
+        return frozenset(dependencies)
 
 
 class Task:
-    def __init__(self, name: str, description: str, difficulty: str, steps: typing.List[Step], prepare_blend: PrepareBlendLambda = mock_startup_blend) -> None:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        difficulty: str,
+        steps: typing.Optional[typing.List[Step]] = None,
+        prepare_blend: PrepareBlendLambda = mock_startup_blend,
+        id: typing.Optional[str] = None,
+        load_steps: typing.Optional[typing.Callable[[], typing.List[Step]]] = None,
+        asset_libraries: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None
+    ) -> None:
+        self.id = id if id is not None else name
         self.name = name
         self.description = description
         # TODO: Make this enum not string
         self.difficulty = difficulty
-        self.steps = steps
+        self._steps = steps
+        # Steps of tasks from quest packs are loaded on first access
+        self._load_steps = load_steps
         self.prepare_blend = prepare_blend
+        # Linked and instanced into the scene after prepare_blend, see assets.py
+        self.asset_libraries = asset_libraries if asset_libraries is not None else []
+        # Catalog entry of the quest file, None for tasks not coming from quest packs
+        self.entry: typing.Optional[catalog.CatalogEntry] = None
+
+        self._steps_by_id: typing.Dict[str, Step] = {}
+        self._indices_by_id: typing.Dict[str, int] = {}
+        # Ids of steps requiring the step with given id
+        self._dependents: typing.Dict[str, typing.List[str]] = {}
+        if steps is not None:
+            self._index_steps()
+
+    @property
+    def steps(self) -> typing.List[Step]:
+        self._ensure_steps_loaded()
+        return self._steps
+
+    def _ensure_steps_loaded(self) -> None:
+        if self._steps is None:
+            self._steps = self._load_steps() if self._load_steps is not None else []
+            self._index_steps()
+
+    def _index_steps(self) -> None:
+        self._steps_by_id = {}
+        self._indices_by_id = {}
+        self._dependents = {}
+        previous_step: typing.Optional[Step] = None
+        for i, step in enumerate(self._steps):
+            if step.id is None:
+                step.id = make_step_id(step.name, self._steps_by_id)
+            if step.id in self._steps_by_id:
+                raise catalog.QuestPackError(f"Duplicate step id '{step.id}' in task '{self.name}'")
+            if step.requires is None:
+                step.requires = (previous_step.id, ) if previous_step is not None else ()
+            # Steps can only require steps listed before them, so the graph can't have cycles
+            # and the order of steps is always a valid order of completing them
+            for required_id in step.requires:
+                if required_id not in self._steps_by_id:
+                    raise catalog.QuestPackError(
+                        f"Step '{step.id}' of task '{self.name}' requires '{required_id}' which "
+                        f"isn't listed before it")
+                self._dependents[required_id].append(step.id)
+            self._steps_by_id[step.id] = step
+            self._indices_by_id[step.id] = i
+            self._dependents[step.id] = []
+            previous_step = step
+
+    def get_step(self, step_id: str) -> typing.Optional[Step]:
+        self._ensure_steps_loaded()
+        return self._steps_by_id.get(step_id, None)
+
+    def get_step_index(self, step_id: str) -> typing.Optional[int]:
+        self._ensure_steps_loaded()
+        return self._indices_by_id.get(step_id, None)
+
+    def get_dependents(self, step_id: str) -> typing.List[Step]:
+        """Returns steps which directly require step with 'step_id'"""
+        self._ensure_steps_loaded()
+        return [self._steps_by_id[dependent_id] for dependent_id in self._dependents.get(step_id, [])]
+
+
+def make_step_id(name: str, taken_ids: typing.Container[str]) -> str:
+    # Derived from the name, so it stays the same as long as the step isn't renamed
+    base_id = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "step"
+    step_id = base_id
+    suffix = 2
+    while step_id in taken_ids:
+        step_id = f"{base_id}_{suffix}"
+        suffix += 1
+    return step_id
 
 
 current_task: typing.Optional[Task] = None
 
 
 # Test functions
+def object_exists(name: str) -> TestLambda:
+    return depends_on('OBJECT')(lambda: name in bpy.data.objects)
+
+
+def object_missing(name: str) -> TestLambda:
+    return depends_on('OBJECT')(lambda: name not in bpy.data.objects)
+
+
+@depends_on('OBJECT', 'MESH')
 def test_monkey_has_material() -> bool:
     if "Suzanne" not in bpy.data.objects:
         return False
@@ -98,105 +310,374 @@ def test_monkey_has_material() -> bool:
     return "MonkeyMaterial" in monkey.data.materials
 
 
+@depends_on('OBJECT', 'MESH', 'MATERIAL', 'NODETREE')
 def monkey_has_red_material() -> bool:
     if not test_monkey_has_material():
         return False
     monkey_material = bpy.data.objects["Suzanne"].data.materials["MonkeyMaterial"]
-    base_color = monkey_material.node_tree.nodes["Principled BSDF"].inputs[0].default_value
     # Red-ish color has R channel bigger than B and G channels
-    return base_color[0] > base_color[1] and base_color[0] > base_color[2]
+    query = import_test_library("node_query").compile_query(RED_BASE_COLOR_QUERY)
+    return query.evaluate(monkey_material)
+
+
+RED_BASE_COLOR_QUERY = {"path": ["Surface", "Base Color"], "expect": "reddish"}
+
+
+def material_node_query(material_name: str, query_spec: typing.Dict[str, typing.Any]) -> TestLambda:
+    node_query = import_test_library("node_query")
+    try:
+        query = node_query.compile_query(query_spec)
+    except node_query.QueryError as e:
+        raise catalog.QuestPackError(f"Invalid test 'material_node_query': {e}") from e
 
+    @depends_on('MATERIAL', 'NODETREE')
+    def test() -> bool:
+        material = bpy.data.materials.get(material_name, None)
+        return material is not None and query.evaluate(material)
+    return test
 
+
+@depends_on(SHADING_DEPENDENCY)
 def is_material_or_render_shading_enabled() -> bool:
-    for area in bpy.context.screen.areas:
-        if area.type != 'VIEW_3D':
-            continue
-        for space in area.spaces:
-            if space.type != 'VIEW_3D':
+    # Go through all windows, context.screen isn't available when checking from timers
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'VIEW_3D':
                 continue
-            if space.shading.type == 'MATERIAL' or space.shading.type == 'RENDERED':
-                return True
+            for space in area.spaces:
+                if space.type != 'VIEW_3D':
+                    continue
+                if space.shading.type == 'MATERIAL' or space.shading.type == 'RENDERED':
+                    return True
     return False
 
 
-# TODO: Load these from files?
-TASKS = [
-    Task(
-        "Red Monkey",
-        "Teaches basics of Blender.",
-        "BEGINNER",
-        [
-            Step(
-                "Remove Default Cube",
-                "Select default cube and press Delete.",
-                [lambda: "Cube" not in bpy.data.objects]
-            ),
-            Step(
-                "Spawn Monkey",
-                "Click Add -> Mesh -> Monkey.",
-                [lambda: "Suzanne" in bpy.data.objects]
-            ),
-            Step(
-                "Add material MonkeyMaterial",
-                "In Properties Window select Material Properties tab, click New to add new "
-                "material and rename it to 'MonkeyMaterial'.",
-                [test_monkey_has_material]
-            ),
-            Step(
-                "Change material color to red",
-                "In Material Properties tab open Surface panel and change Base Color to red.",
-                [monkey_has_red_material]
-            ),
-            Step(
-                "View result",
-                "You noticed that color of the monkey object didn't change. It's because we are in "
-                "Solid view mode. Change Viewport shading to Material Preview or Rendered.",
-                [is_material_or_render_shading_enabled]
-            ),
-        ]
-    ),
-    Task(
-        "Destroy traffiq vehicle",
-        "How to add dirt, scratches and bumps to the traffiq assets.",
-        "MEDIUM",
-        [
-            Step(
-                "Remove Default Cube",
-                "Select default cube and press Delete.",
-                [lambda: "Cube" not in bpy.data.objects]
-            ),
-            # TODO: Add steps
-        ]
-    ),
-]
+def _mesh_test(module_name: str, factory_name: str) -> typing.Callable[..., TestLambda]:
+    def factory(*args: typing.Any) -> TestLambda:
+        test_factory = getattr(import_test_library(module_name), factory_name)
+        return depends_on('OBJECT', 'MESH')(test_factory(*args))
+    return factory
+
+
+def render_matches_reference(*args: typing.Any) -> TestLambda:
+    render_compare = import_test_library("render_compare")
+    return depends_on(*render_compare.RENDER_DEPENDENCIES)(render_compare.render_matches_reference(*args))
+
+
+# Tests referenced from quest packs by name, arguments from the pack are passed to the factory
+TEST_FACTORIES: typing.Dict[str, typing.Callable[..., TestLambda]] = {
+    "object_exists": object_exists,
+    "object_missing": object_missing,
+    "monkey_has_material": lambda: test_monkey_has_material,
+    "monkey_has_red_material": lambda: monkey_has_red_material,
+    "material_or_render_shading_enabled": lambda: is_material_or_render_shading_enabled,
+    "material_node_query": material_node_query,
+    "vertices_displaced": _mesh_test("geometry", "vertices_displaced"),
+    "bumps_applied": _mesh_test("geometry", "bumps_applied"),
+    "max_displacement_at_least": _mesh_test("geometry", "max_displacement_at_least"),
+    "mean_displacement_between": _mesh_test("geometry", "mean_displacement_between"),
+    "vertex_count_at_least": _mesh_test("geometry", "vertex_count_at_least"),
+    "shape_matches_reference": _mesh_test("shape_compare", "shape_matches_reference"),
+    "render_matches_reference": render_matches_reference,
+}
+
+
+PREPARE_BLEND_FUNCTIONS: typing.Dict[str, PrepareBlendLambda] = {
+    "mock_startup_blend": mock_startup_blend,
+}
+
+
+def make_predicate_test(spec: typing.Dict[str, typing.Any], compiler: typing.Any) -> TestLambda:
+    predicate = import_test_library("predicate")
+    try:
+        test = compiler.compile_test(spec["predicate"], spec.get("depends_on", None))
+    except predicate.PredicateError as e:
+        raise catalog.QuestPackError(f"Invalid predicate {predicate.describe(spec['predicate'])}: {e}") from e
+    # Tests are profiled under their label, distinct predicates mustn't share one
+    test.label = spec.get("label", None) or predicate.get_label(spec["predicate"])
+    # Predicates only read the scene
+    test.reorderable = spec.get("reorder", True)
+    return test
+
+
+def make_test(
+    spec: typing.Union[str, typing.Dict[str, typing.Any]],
+    get_compiler: typing.Optional[typing.Callable[[], typing.Any]] = None
+) -> TestLambda:
+    """Creates test from its spec, 'get_compiler' returns the predicate compiler of the task"""
+    if isinstance(spec, str):
+        spec = {"test": spec}
+    if not isinstance(spec, dict):
+        raise catalog.QuestPackError(f"Test spec {spec!r} is neither a name nor an object")
+    if "predicate" in spec:
+        compiler = get_compiler() if get_compiler is not None else import_test_library("predicate").Compiler()
+        return make_predicate_test(spec, compiler)
+    factory = TEST_FACTORIES.get(spec.get("test", None), None)
+    if factory is None:
+        raise catalog.QuestPackError(f"Unknown test '{spec.get('test', None)}'")
+    args = spec.get("args", [])
+    if not isinstance(args, list):
+        raise catalog.QuestPackError(f"Arguments of test '{spec['test']}' aren't a list")
+    try:
+        test = factory(*args)
+    except (TypeError, ValueError) as e:
+        raise catalog.QuestPackError(f"Invalid arguments of test '{spec['test']}': {e}") from e
+    if not hasattr(test, "depends_on"):
+        # Still evaluate it only once per check cycle
+        test = test_cache.memoize(test, None)
+    test.label = f"{spec['test']}({', '.join(repr(arg) for arg in args)})" if len(args) > 0 else spec["test"]
+    if "reorder" in spec:
+        test.reorderable = bool(spec["reorder"])
+    return test
+
+
+def make_solution(spec: typing.Union[str, typing.Dict[str, typing.Any]]) -> SolutionLambda:
+    if isinstance(spec, str):
+        spec = {"function": spec}
+    if not isinstance(spec, dict):
+        raise catalog.QuestPackError(f"Solution spec {spec!r} is neither a name nor an object")
+    solutions = import_test_library("solutions")
+    factory = solutions.SOLUTION_FACTORIES.get(spec.get("function", None), None)
+    if factory is None:
+        raise catalog.QuestPackError(f"Unknown solution '{spec.get('function', None)}'")
+    args = spec.get("args", [])
+    if not isinstance(args, list):
+        raise catalog.QuestPackError(f"Arguments of solution '{spec['function']}' aren't a list")
+    try:
+        return factory(*args)
+    except (TypeError, ValueError) as e:
+        raise catalog.QuestPackError(f"Invalid arguments of solution '{spec['function']}': {e}") from e
+
+
+# Keys every step has to have and their types
+STEP_KEYS = (("name", str), ("description", str), ("tests", list))
+
+
+def _validate_step_data(step_data: typing.Any, index: int) -> None:
+    if not isinstance(step_data, dict):
+        raise catalog.QuestPackError(f"Step {index} isn't an object")
+    for key, value_type in STEP_KEYS:
+        if key not in step_data:
+            raise catalog.QuestPackError(f"Step {index} is missing key '{key}'")
+        if not isinstance(step_data[key], value_type):
+            raise catalog.QuestPackError(f"'{key}' of step {index} isn't a {value_type.__name__}")
+
+
+def make_steps(task_data: typing.Dict[str, typing.Any], path: str) -> typing.List[Step]:
+    """Creates steps of the task file at 'path', raises QuestPackError if they are invalid"""
+    # Predicates of all steps share one compiler, so they share subexpressions too
+    compiler = None
+
+    def get_compiler() -> typing.Any:
+        nonlocal compiler
+        if compiler is None:
+            compiler = import_test_library("predicate").Compiler()
+        return compiler
+
+    steps_data = task_data.get("steps", [])
+    if not isinstance(steps_data, list):
+        raise catalog.QuestPackError(f"Steps in '{path}' aren't a list")
+    steps = []
+    for i, step_data in enumerate(steps_data):
+        try:
+            _validate_step_data(step_data, i)
+            solution_spec = step_data.get("solution", None)
+            steps.append(Step(
+                step_data["name"],
+                step_data["description"],
+                [make_test(spec, get_compiler) for spec in step_data["tests"]],
+                make_solution(solution_spec) if solution_spec is not None else None,
+                step_data.get("id", None),
+                step_data.get("requires", None)
+            ))
+        except catalog.QuestPackError as e:
+            raise catalog.QuestPackError(f"{e} in '{path}'") from e
+    return steps
+
+
+def make_task(entry: catalog.CatalogEntry) -> Task:
+    # Prepare blend function is part of the task file, it is resolved together with the steps
+    task = Task(
+        entry.name, entry.description, entry.difficulty, id=entry.id, asset_libraries=entry.asset_libraries)
+    task.entry = entry
+
+    def load_steps() -> typing.List[Step]:
+        task_data = entry.read_task_data()
+        startup_file = task_data.get("startup_file", None)
+        if startup_file is not None:
+            task.prepare_blend = lambda: prepare_blend_from_template(startup_file)
+            return make_steps(task_data, entry.path)
+
+        prepare_blend_name = task_data.get("prepare_blend", "mock_startup_blend")
+        if prepare_blend_name not in PREPARE_BLEND_FUNCTIONS:
+            raise catalog.QuestPackError(f"Unknown prepare_blend '{prepare_blend_name}'")
+        task.prepare_blend = PREPARE_BLEND_FUNCTIONS[prepare_blend_name]
+        return make_steps(task_data, entry.path)
+
+    task._load_steps = load_steps
+    return task
+
+
+_catalog: typing.Optional[catalog.Catalog] = None
+
+
+def get_catalog() -> catalog.Catalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = catalog.Catalog(search.SearchIndex(get_task_search_terms))
+        for entry in catalog.load_catalog_entries():
+            try:
+                _catalog.add(make_task(entry))
+            except catalog.QuestPackError as e:
+                logger.error(f"Skipping quest: {e}")
+    return _catalog
+
+
+def get_task_search_terms(task: Task) -> typing.Dict[str, float]:
+    step_terms = task.entry.step_terms if task.entry is not None else []
+    return search.get_weighted_terms([
+        (catalog.tokenize(task.name), search.NAME_WEIGHT),
+        (catalog.tokenize(task.description), search.DESCRIPTION_WEIGHT),
+        (step_terms, search.STEP_WEIGHT),
+    ])
+
+
+def search_tasks(query: str) -> typing.List[str]:
+    """Returns names of tasks matching 'query' of all difficulties, best match first"""
+    return get_catalog().search_index.search(query)
 
 
 # TODO: Use enum for difficulty not string
 def get_available_tasks(difficulty: str) -> typing.List[str]:
-    return [task.name for task in TASKS if task.difficulty == difficulty]
+    return get_catalog().get_names(difficulty)
 
 
 def load_task(task_name: str, prefs: preferences.Preferences) -> bool:
     global current_task
-    for task in TASKS:
-        if task.name != task_name:
-            continue
+    task = get_catalog().get(task_name)
+    if task is None:
+        return False
+
+    try:
+        steps = task.steps
+    except catalog.QuestPackError as e:
+        logger.error(f"Couldn't load task '{task_name}': {e}")
+        return False
 
-        current_task = task
+    current_task = task
+    with profiling.measure(f"prepare_blend:{task.id}"):
+        # Removes whatever the previous run of a task created, restarts must not leak
+        checkpoints.reset()
+        sandbox.enter()
         task.prepare_blend()
-        prefs.task.name = task.name
-        prefs.task.description = task.description
-        prefs.task.current_step = 0
-        prefs.task.steps.clear()
-        for step in task.steps:
-            prefs_step = prefs.task.steps.add()
-            prefs_step.name = step.name
-            prefs_step.description = step.description
-        return True
-    return False
+        if len(task.asset_libraries) > 0:
+            assets.instantiate(task.asset_libraries, bpy.context.view_layer.active_layer_collection.collection)
+    start_tests(task)
+    sync_task_properties(task, prefs.task)
+    apply_progress(task, prefs.task, set())
+    fingerprint = progress.stamp_scene(bpy.context.scene)
+    progress.write_record(progress.ProgressRecord(task.id, [], fingerprint))
+    checkpoints.create(None, [])
+    next_task = get_catalog().get_next(task.name)
+    if next_task is not None:
+        assets.prefetch(next_task.asset_libraries)
+    return True
+
+
+def _clear_rest_coords() -> None:
+    geometry = sys.modules.get(f"{__package__}.geometry", None)
+    if geometry is not None:
+        geometry.clear_rest_coords()
+
+
+def start_tests(task: Task) -> None:
+    """Lets tests capture the state of the freshly prepared scene, e.g. rest positions"""
+    _clear_rest_coords()
+    for step in task.steps:
+        for test in step.tests:
+            on_task_start = getattr(test, "on_task_start", None)
+            if on_task_start is not None:
+                on_task_start()
+
+
+def get_current_task(prefs: preferences.Preferences) -> typing.Optional[Task]:
+    """Returns the task in progress, resumes it if the open file is the scene it was played in"""
+    global current_task
+    if current_task is not None:
+        return current_task
+
+    record = progress.find_matching_record(bpy.context.scene)
+    if record is None:
+        return None
+    task = get_catalog().get_by_id(record.task_id)
+    if task is None:
+        return None
+    try:
+        sync_task_properties(task, prefs.task)
+    except catalog.QuestPackError as e:
+        logger.error(f"Couldn't resume task '{task.name}': {e}")
+        return None
+
+    completed_step_ids = {step_id for step_id in record.completed_steps if task.get_step(step_id) is not None}
+    apply_progress(task, prefs.task, completed_step_ids)
+    # Rest positions of another file could be in memory, the ones stored in this scene are used
+    _clear_rest_coords()
+    current_task = task
+    logger.info(f"Resumed task '{task.name}' with {len(completed_step_ids)} completed steps")
+    return current_task
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    global current_task
+    # The task is bound again lazily if the loaded file is the scene of the task
+    current_task = None
+
+
+def sync_task_properties(task: Task, task_props: preferences.TaskProperties) -> None:
+    """Updates 'task_props' to match 'task' in place, only changed values are written"""
+    def set_if_changed(props: bpy.types.PropertyGroup, attr: str, value: str) -> None:
+        if getattr(props, attr) != value:
+            setattr(props, attr, value)
+
+    set_if_changed(task_props, "name", task.name)
+    set_if_changed(task_props, "description", task.description)
+    steps = task.steps
+    prefs_steps = task_props.steps
+    for i, step in enumerate(steps):
+        prefs_step = prefs_steps[i] if i < len(prefs_steps) else prefs_steps.add()
+        set_if_changed(prefs_step, "step_id", step.id)
+        set_if_changed(prefs_step, "name", step.name)
+        set_if_changed(prefs_step, "description", step.description)
+    for i in range(len(prefs_steps) - 1, len(steps) - 1, -1):
+        prefs_steps.remove(i)
+
+
+def apply_progress(
+    task: Task,
+    task_props: preferences.TaskProperties,
+    completed_step_ids: typing.Set[str]
+) -> None:
+    """Sets state of all steps, expects 'task_props' synced with 'task'"""
+    for step, step_props in zip(task.steps, task_props.steps):
+        if step.id in completed_step_ids:
+            state = 'COMPLETED'
+        elif all(required_id in completed_step_ids for required_id in step.requires):
+            state = 'AVAILABLE'
+        else:
+            state = 'LOCKED'
+        if step_props.state != state:
+            step_props.state = state
+    # Steps could have been added or removed by sync_task_properties too
+    task_props.update_step_states()
 
 
 def register():
+    templates.register()
+    sandbox.register()
+    checkpoints.register()
+    assets.register()
+    bpy.app.handlers.load_post.append(_load_post)
     for cls in MODULE_CLASSES:
         telemetry.wrap_blender_class(cls)
         bpy.utils.register_class(cls)
@@ -205,3 +686,8 @@ def register():
 def unregister():
     for cls in reversed(MODULE_CLASSES):
         bpy.utils.unregister_class(cls)
+    bpy.app.handlers.load_post.remove(_load_post)
+    assets.unregister()
+    checkpoints.unregister()
+    sandbox.unregister()
+    templates.unregister()
@@ -21,6 +21,7 @@
 
 import os
 import bpy
+import time
 import typing
 
 
@@ -28,11 +29,25 @@ if "polib" not in locals():
     import polib
     from . import preferences
     from . import loader
+    from . import test_cache
+    from . import profiling
+    from . import test_order
+    from . import progress
+    from . import checkpoints
+    from . import analytics
+    from . import background_check
 else:
     import importlib
     polib = importlib.reload(polib)
     preferences = importlib.reload(preferences)
     loader = importlib.reload(loader)
+    test_cache = importlib.reload(test_cache)
+    profiling = importlib.reload(profiling)
+    test_order = importlib.reload(test_order)
+    progress = importlib.reload(progress)
+    checkpoints = importlib.reload(checkpoints)
+    analytics = importlib.reload(analytics)
+    background_check = importlib.reload(background_check)
 
 
 telemetry = polib.get_telemetry("quest_system")
@@ -41,26 +56,172 @@ telemetry = polib.get_telemetry("quest_system")
 MODULE_CLASSES: typing.List[typing.Type] = []
 
 
-# TODO: Add periodical checking of current step
+def get_frontier_steps(prefs: preferences.Preferences) -> typing.List[loader.Step]:
+    """Returns steps which are unlocked and not completed, no other step needs to be checked"""
+    task = loader.get_current_task(prefs)
+    if task is None:
+        return []
+
+    steps = []
+    for step_props in prefs.task.get_frontier():
+        step_data = task.get_step(step_props.step_id)
+        if step_data is not None:
+            steps.append(step_data)
+    return steps
+
+
+def get_step_properties_index(prefs: preferences.Preferences, step_id: str) -> typing.Optional[int]:
+    task = loader.get_current_task(prefs)
+    if task is None:
+        return None
+    # Steps are stored in the same order, the index only fails if the task changed since load
+    index = task.get_step_index(step_id)
+    if index is not None and index < len(prefs.task.steps) and prefs.task.steps[index].step_id == step_id:
+        return index
+    for i, step_props in enumerate(prefs.task.steps):
+        if step_props.step_id == step_id:
+            return i
+    return None
+
+
+def get_step_properties(
+    prefs: preferences.Preferences,
+    step_id: str
+) -> typing.Optional[preferences.StepProperties]:
+    index = get_step_properties_index(prefs, step_id)
+    return prefs.task.steps[index] if index is not None else None
+
+
+def is_step_available(prefs: preferences.Preferences, step_id: str) -> bool:
+    step_props = get_step_properties(prefs, step_id)
+    return step_props is not None and step_props.state == 'AVAILABLE'
+
+
+def check_step(step_data: loader.Step, use_cache: bool = True) -> bool:
+    # Without cache tests are still evaluated at most once, even when they call each other
+    with test_cache.check_cycle(use_versions=use_cache):
+        for test, name in test_order.iter_tests(step_data.id, step_data.tests, step_data.test_labels):
+            if not profiling.run_test(name, test):
+                return False
+        return True
+
+
+def check_step_in_background(
+    step_data: loader.Step,
+    on_done: typing.Callable[[bool], None],
+    use_cache: bool = True
+) -> typing.Optional[bool]:
+    """Like check_step, but expensive tests are evaluated in worker threads.
+
+    Returns the result if it is known right away, otherwise returns None and 'on_done' is called
+    with the result later, from the main thread.
+    """
+    jobs = []
+    handed_over = False
+    try:
+        with test_cache.check_cycle(use_versions=use_cache):
+            # Cheap tests likely to fail go first, expensive ones aren't even submitted then
+            for test, name in test_order.iter_tests(step_data.id, step_data.tests, step_data.test_labels):
+                if not background_check.is_expensive(test):
+                    if not profiling.run_test(name, test):
+                        return False
+                    continue
+
+                get_memoized = getattr(test, "get_memoized", None)
+                key, result = get_memoized() if get_memoized is not None else (None, None)
+                if result is None:
+                    job = background_check.submit(name, test, key)
+                    if job is not None:
+                        jobs.append(job)
+                        continue
+                    result = False
+                if not result:
+                    return False
+
+        if len(jobs) == 0:
+            return True
+        background_check.start_check(step_data.id, jobs, on_done)
+        handed_over = True
+        return None
+    finally:
+        # Nobody reads results of jobs submitted before the step failed, workers can skip them
+        if not handed_over:
+            for job in jobs:
+                job.future.cancel()
+
+
+def complete_step(prefs: preferences.Preferences, step_data: loader.Step) -> typing.List[loader.Step]:
+    """Marks the step completed, returns the steps this unlocked"""
+    task = loader.get_current_task(prefs)
+    index = get_step_properties_index(prefs, step_data.id)
+    if task is None or index is None or prefs.task.steps[index].state == 'COMPLETED':
+        return []
+    prefs.task.set_step_state(index, 'COMPLETED')
+
+    # Only steps requiring the completed step can get unlocked by it
+    unlocked = []
+    for dependent in task.get_dependents(step_data.id):
+        dependent_index = get_step_properties_index(prefs, dependent.id)
+        if dependent_index is None or prefs.task.steps[dependent_index].state != 'LOCKED':
+            continue
+        if all(get_step_properties(prefs, required_id).state == 'COMPLETED' for required_id in dependent.requires):
+            prefs.task.set_step_state(dependent_index, 'AVAILABLE')
+            unlocked.append(dependent)
+
+    completed_step_ids = prefs.task.get_completed_step_ids()
+    progress.update_completed_steps(completed_step_ids)
+    checkpoints.create(step_data.id, completed_step_ids)
+    analytics.record_step_completed(task.id, step_data.id)
+    track_available_steps(prefs, task)
+    return unlocked
+
+
+def track_available_steps(prefs: preferences.Preferences, task: loader.Task) -> None:
+    analytics.track_available_steps(task.id, [step_props.step_id for step_props in prefs.task.get_frontier()])
+
+
+def can_rewind(step_id: str) -> bool:
+    return checkpoints.has_checkpoint(step_id)
+
+
+def rewind_to_step(prefs: preferences.Preferences, step_id: str) -> bool:
+    """Restores the scene and progress as they were when the step was passed"""
+    task = loader.get_current_task(prefs)
+    if task is None:
+        return False
+    # Results of checks started before the rewind would complete steps of the newer scene
+    background_check.cancel()
+    completed_step_ids = checkpoints.rewind(step_id)
+    if completed_step_ids is None:
+        return False
+    loader.apply_progress(task, prefs.task, set(completed_step_ids))
+    progress.update_completed_steps(list(completed_step_ids))
+    track_available_steps(prefs, task)
+    return True
+
 
 class StartTask(bpy.types.Operator):
     bl_idname = "quest_system.start_task"
     bl_label = "Start Task"
     bl_description = "Starts task with the given name, can be also used to restart task"
 
-    bl_options = {'REGISTER', 'UNDO'}
+    bl_options = {'REGISTER'}
 
     task_name: bpy.props.StringProperty(
         default=""
     )
 
     def execute(self, context):
-        loaded_successfully = loader.load_task(self.task_name, preferences.get_preferences(context))
+        prefs = preferences.get_preferences(context)
+        loaded_successfully = loader.load_task(self.task_name, prefs)
         if not loaded_successfully:
             self.report(
                 {'ERROR'}, f"Task '{self.task_name}' was not loaded successfully, does it exist?")
             return {'CANCELLED'}
 
+        task = loader.get_current_task(prefs)
+        analytics.record_task_start(task.id)
+        track_available_steps(prefs, task)
         return {'FINISHED'}
 
 
@@ -72,36 +233,85 @@ class CheckCurrentStep(bpy.types.Operator):
     bl_label = "Not yet! Try one more time!"
     bl_description = "Checks if current step was satisfied"
 
-    bl_options = {'REGISTER', 'UNDO'}
+    # Passed steps are checkpointed, a global undo step of the whole file isn't needed
+    bl_options = {'REGISTER'}
+
+    # Empty checks the first unlocked step
+    step_id: bpy.props.StringProperty(
+        default=""
+    )
 
     def execute(self, context):
         prefs = preferences.get_preferences(context)
+        if loader.get_current_task(prefs) is None:
+            self.report(
+                {'ERROR'}, f"This scene doesn't belong to task '{prefs.task.name}', restart the task!")
+            return {'CANCELLED'}
+
         if prefs.task.is_finished():
             return {'FINISHED'}
 
-        current_step = prefs.task.get_current_step()
-        if current_step is None:
-            self.report({'ERROR'}, f"Couldn't retrieve current step!")
+        frontier = get_frontier_steps(prefs)
+        if self.step_id == "":
+            step_data = frontier[0] if len(frontier) > 0 else None
+        else:
+            step_data = next((step for step in frontier if step.id == self.step_id), None)
+        if step_data is None:
+            self.report(
+                {'ERROR'}, f"Step '{self.step_id}' isn't unlocked in the current task!")
             return {'CANCELLED'}
 
-        for step_data in loader.current_task.steps:
-            if step_data.name == current_step.name:
-                if all(test() for test in step_data.tests):
-                    prefs.task.current_step += 1
-                    return {'FINISHED'}
-                else:
-                    polib.ui.show_message_box(
-                        "Try one more time!", "Not yet!", 'ERROR')
-                    return {'FINISHED'}
+        task = loader.get_current_task(prefs)
+        start = time.perf_counter()
+
+        def on_done(passed: bool) -> None:
+            prefs = preferences.get_preferences(bpy.context)
+            # The task could have been restarted while the tests were evaluated
+            if not is_step_available(prefs, step_data.id):
+                return
+            analytics.record_submission(task.id, step_data.id, passed, time.perf_counter() - start)
+            if passed:
+                complete_step(prefs, step_data)
+            else:
+                polib.ui.show_message_box(
+                    "Try one more time!", "Not yet!", 'ERROR')
 
-        self.report({'ERROR'}, f"Not found step with name '{self.step.name}' in the current task!")
-        return {'CANCELLED'}
+        # The learner explicitly asked, don't trust anything cached
+        passed = check_step_in_background(step_data, on_done, use_cache=False)
+        if passed is not None:
+            on_done(passed)
+        return {'FINISHED'}
 
 
 MODULE_CLASSES.append(CheckCurrentStep)
 
 
+class RewindToStep(bpy.types.Operator):
+    bl_idname = "quest_system.rewind_to_step"
+    bl_label = "Rewind to Step"
+    bl_description = "Returns the scene to the state it was in when this step was passed"
+
+    bl_options = {'REGISTER'}
+
+    step_id: bpy.props.StringProperty(
+        default=""
+    )
+
+    def execute(self, context):
+        prefs = preferences.get_preferences(context)
+        if not rewind_to_step(prefs, self.step_id):
+            self.report(
+                {'ERROR'}, f"Can't rewind to step '{self.step_id}', restart the task instead!")
+            return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+
+MODULE_CLASSES.append(RewindToStep)
+
+
 def register():
+    analytics.register()
     for cls in MODULE_CLASSES:
         telemetry.wrap_blender_class(cls)
         bpy.utils.register_class(cls)
@@ -110,3 +320,4 @@ def register():
 def unregister():
     for cls in reversed(MODULE_CLASSES):
         bpy.utils.unregister_class(cls)
+    analytics.unregister()
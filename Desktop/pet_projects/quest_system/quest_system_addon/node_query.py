@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Declarative queries over material node trees. A query follows input sockets by name starting at
+# the active Material Output, e.g. path ["Surface", "Base Color"] is the Base Color of whatever
+# shader is plugged into the output, no matter how the nodes are named. The reached socket is
+# resolved to a value (its default value, or the value of a plugged RGB or Value node) and checked
+# by the expectation of the query:
+#   {"path": ["Surface", "Base Color"], "expect": "reddish"}
+#   {"path": ["Surface", "Roughness"], "expect": "approx", "value": 0.2, "tolerance": 0.05}
+#   {"path": ["Surface", "Base Color"], "expect": "linked_from", "node_type": "TEX_IMAGE"}
+#
+# Queries are compiled once. Every material gets an index of its links by node and socket names,
+# rebuilt only when the material changes.
+
+import bpy
+import json
+import typing
+
+
+if "test_cache" not in locals():
+    from . import test_cache
+else:
+    import importlib
+    test_cache = importlib.reload(test_cache)
+
+
+class QueryError(Exception):
+    pass
+
+
+class StaleIndexError(Exception):
+    """Node named by the index doesn't exist, e.g. it was renamed and counts didn't change"""
+    pass
+
+
+class ResolvedSocket:
+    __slots__ = ("value", "from_node_type")
+
+    def __init__(self, value: typing.Optional[typing.Tuple[float, ...]], from_node_type: typing.Optional[str]) -> None:
+        # None if the value is computed by nodes we don't evaluate
+        self.value = value
+        # Type of the node plugged into the socket, None if unlinked
+        self.from_node_type = from_node_type
+
+
+class MaterialGraphIndex:
+    """Links of a node tree by names, node references aren't safe to keep across edits"""
+
+    def __init__(self, node_tree: bpy.types.NodeTree) -> None:
+        # (to node name, to socket identifier) -> (from node name, from socket identifier)
+        self.links: typing.Dict[typing.Tuple[str, str], typing.Tuple[str, str]] = {}
+        for link in node_tree.links:
+            if not link.is_valid or getattr(link, "is_muted", False):
+                continue
+            self.links[(link.to_node.name, link.to_socket.identifier)] = \
+                (link.from_node.name, link.from_socket.identifier)
+
+        self.output_node_name: typing.Optional[str] = None
+        for node in node_tree.nodes:
+            if node.type == 'OUTPUT_MATERIAL' and (self.output_node_name is None or node.is_active_output):
+                self.output_node_name = node.name
+
+    def get_upstream(
+        self,
+        nodes: bpy.types.Nodes,
+        node: bpy.types.Node,
+        socket: bpy.types.NodeSocket
+    ) -> typing.Optional[typing.Tuple[bpy.types.Node, bpy.types.NodeSocket]]:
+        link = self.links.get((node.name, socket.identifier), None)
+        while link is not None:
+            from_node = nodes.get(link[0], None)
+            if from_node is None:
+                raise StaleIndexError(link[0])
+            if from_node.type != 'REROUTE':
+                return from_node, _get_output(from_node, link[1])
+            link = self.links.get((from_node.name, from_node.inputs[0].identifier), None)
+        return None
+
+
+def _get_output(node: bpy.types.Node, identifier: str) -> typing.Optional[bpy.types.NodeSocket]:
+    for socket in node.outputs:
+        if socket.identifier == identifier:
+            return socket
+    return None
+
+
+# Per material name: (version key, index)
+_indices: typing.Dict[str, typing.Tuple[typing.Tuple[int, ...], MaterialGraphIndex]] = {}
+
+
+def get_graph_index(material: bpy.types.Material, rebuild: bool = False) -> MaterialGraphIndex:
+    """Returns the index of the node tree of 'material', rebuilt only when the material changed"""
+    node_tree = material.node_tree
+    # Edits of the node tree are reported for the material. Node and link counts guard against
+    # edits the depsgraph didn't report, renames are caught by StaleIndexError.
+    version = test_cache.get_datablock_version('MATERIAL', material.name) + \
+        (len(node_tree.nodes), len(node_tree.links))
+    cached = _indices.get(material.name, None)
+    if not rebuild and cached is not None and cached[0] == version:
+        return cached[1]
+    index = MaterialGraphIndex(node_tree)
+    _indices[material.name] = (version, index)
+    return index
+
+
+def _as_tuple(value: typing.Any) -> typing.Tuple[float, ...]:
+    try:
+        return tuple(value)
+    except TypeError:
+        return (value,)
+
+
+def _expect_dominant_channel(channel: int) -> typing.Callable[[ResolvedSocket], bool]:
+    def expectation(resolved: ResolvedSocket) -> bool:
+        if resolved.value is None or len(resolved.value) < 3:
+            return False
+        others = [resolved.value[i] for i in range(3) if i != channel]
+        return all(resolved.value[channel] > other for other in others)
+    return expectation
+
+
+def _expect_approx(spec: typing.Dict[str, typing.Any]) -> typing.Callable[[ResolvedSocket], bool]:
+    if "value" not in spec:
+        raise QueryError("'approx' expectation needs 'value'")
+    expected = _as_tuple(spec["value"])
+    tolerance = spec.get("tolerance", 1e-3)
+
+    def expectation(resolved: ResolvedSocket) -> bool:
+        if resolved.value is None:
+            return False
+        return all(abs(a - b) <= tolerance for a, b in zip(resolved.value, expected))
+    return expectation
+
+
+def _expect_linked_from(spec: typing.Dict[str, typing.Any]) -> typing.Callable[[ResolvedSocket], bool]:
+    if "node_type" not in spec:
+        raise QueryError("'linked_from' expectation needs 'node_type'")
+    node_type = spec["node_type"]
+    return lambda resolved: resolved.from_node_type == node_type
+
+
+EXPECTATIONS: typing.Dict[str, typing.Callable[[typing.Dict[str, typing.Any]], typing.Callable[[ResolvedSocket], bool]]] = {
+    "reddish": lambda spec: _expect_dominant_channel(0),
+    "greenish": lambda spec: _expect_dominant_channel(1),
+    "bluish": lambda spec: _expect_dominant_channel(2),
+    "approx": _expect_approx,
+    "linked_from": _expect_linked_from,
+}
+
+
+class CompiledQuery:
+    def __init__(self, path: typing.Tuple[str, ...], expectation: typing.Callable[[ResolvedSocket], bool]) -> None:
+        self.path = path
+        self.expectation = expectation
+
+    def resolve(self, material: bpy.types.Material) -> typing.Optional[ResolvedSocket]:
+        if material.node_tree is None:
+            return None
+        try:
+            return self._resolve(material, get_graph_index(material))
+        except StaleIndexError:
+            pass
+        try:
+            return self._resolve(material, get_graph_index(material, rebuild=True))
+        except StaleIndexError:
+            return None
+
+    def _resolve(self, material: bpy.types.Material, index: MaterialGraphIndex) -> typing.Optional[ResolvedSocket]:
+        if index.output_node_name is None:
+            return None
+
+        nodes = material.node_tree.nodes
+        node = nodes.get(index.output_node_name, None)
+        if node is None:
+            raise StaleIndexError(index.output_node_name)
+        for i, socket_name in enumerate(self.path):
+            socket = node.inputs.get(socket_name, None)
+            if socket is None:
+                return None
+            upstream = index.get_upstream(nodes, node, socket)
+            if i < len(self.path) - 1:
+                if upstream is None:
+                    return None
+                node = upstream[0]
+                continue
+
+            if upstream is None:
+                return ResolvedSocket(_as_tuple(socket.default_value), None)
+            from_node, from_socket = upstream
+            value = None
+            if from_node.type in {'RGB', 'VALUE'} and from_socket is not None:
+                value = _as_tuple(from_socket.default_value)
+            return ResolvedSocket(value, from_node.type)
+        return None
+
+    def evaluate(self, material: bpy.types.Material) -> bool:
+        resolved = self.resolve(material)
+        return resolved is not None and self.expectation(resolved)
+
+
+_compiled: typing.Dict[str, CompiledQuery] = {}
+
+
+def compile_query(spec: typing.Dict[str, typing.Any]) -> CompiledQuery:
+    key = json.dumps(spec, sort_keys=True)
+    query = _compiled.get(key, None)
+    if query is not None:
+        return query
+
+    path = spec.get("path", None)
+    if not isinstance(path, list) or len(path) == 0:
+        raise QueryError(f"Query needs non-empty 'path': {key}")
+    expectation_factory = EXPECTATIONS.get(spec.get("expect", None), None)
+    if expectation_factory is None:
+        raise QueryError(f"Unknown expectation '{spec.get('expect', None)}'")
+
+    query = _compiled[key] = CompiledQuery(tuple(path), expectation_factory(spec))
+    return query
+
+
+def clear_cache() -> None:
+    _indices.clear()
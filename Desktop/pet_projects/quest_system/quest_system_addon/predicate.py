@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Declarative step tests. A predicate is a JSON expression, lists are operator applications and
+# everything else is a literal:
+#   ["and", ["exists", ["object", "Suzanne"]], [">", ["len", ["attr", ["object", "Suzanne"], "data.vertices"]], 500]]
+# Predicates are compiled once into closures. All predicates of a task share one Compiler, equal
+# subexpressions (e.g. ["object", "Suzanne"] used by several steps) become one node which is
+# evaluated at most once per check cycle. Only data is read, predicates can't call anything, so
+# quest authors can't break the scene by a test.
+
+import bpy
+import json
+import typing
+import hashlib
+
+
+if "test_cache" not in locals():
+    from . import test_cache
+    from . import node_query
+else:
+    import importlib
+    test_cache = importlib.reload(test_cache)
+    node_query = importlib.reload(node_query)
+
+
+TestLambda = typing.Callable[[], bool]
+Dependencies = typing.Optional[typing.FrozenSet[str]]
+
+
+class PredicateError(Exception):
+    pass
+
+
+class Node:
+    __slots__ = ("evaluate", "depends_on")
+
+    def __init__(self, evaluate: typing.Callable[[], typing.Any], depends_on: Dependencies) -> None:
+        self.evaluate = evaluate
+        # ID types the value depends on, None if it can depend on anything
+        self.depends_on = depends_on
+
+
+_MISSING = object()
+
+
+def _union(*dependencies: Dependencies) -> Dependencies:
+    result: typing.Set[str] = set()
+    for dependency in dependencies:
+        if dependency is None:
+            return None
+        result.update(dependency)
+    return frozenset(result)
+
+
+def _plain(value: typing.Any) -> typing.Any:
+    # bpy arrays (colors, vectors) compare like tuples
+    if not isinstance(value, (str, bytes)) and hasattr(value, "__len__") and hasattr(value, "__getitem__"):
+        try:
+            return tuple(value)
+        except TypeError:
+            return value
+    return value
+
+
+class Compiler:
+    """Compiles predicates of one task, equal subexpressions of all of them are shared"""
+
+    def __init__(self) -> None:
+        # Compiled subexpressions by their canonical JSON
+        self._nodes: typing.Dict[str, Node] = {}
+        self._slot_count = 0
+        # Values of subexpressions evaluated in the current check cycle, by slot
+        self._cycle: typing.Optional[int] = None
+        self._values: typing.Dict[int, typing.Any] = {}
+
+    def compile_test(
+        self,
+        expression: typing.Any,
+        depends_on: typing.Optional[typing.Iterable[str]] = None
+    ) -> TestLambda:
+        """Compiles 'expression' to a memoized test, 'depends_on' overrides the inferred ID types"""
+        node = self.compile(expression)
+        evaluate = node.evaluate
+
+        def test() -> bool:
+            return bool(evaluate())
+
+        dependencies = frozenset(depends_on) if depends_on is not None else node.depends_on
+        return test_cache.memoize(test, dependencies)
+
+    def compile(self, expression: typing.Any) -> Node:
+        if isinstance(expression, dict):
+            raise PredicateError(f"Objects are only allowed as arguments of 'node_query': {describe(expression)}")
+        if not isinstance(expression, list):
+            return Node(lambda: expression, frozenset())
+
+        key = json.dumps(expression, sort_keys=True)
+        node = self._nodes.get(key, None)
+        if node is not None:
+            return node
+
+        if len(expression) == 0 or not isinstance(expression[0], str):
+            raise PredicateError(f"Expression has to start with an operator: {key}")
+        operator = OPERATORS.get(expression[0], None)
+        if operator is None:
+            raise PredicateError(f"Unknown operator '{expression[0]}'")
+        min_args, max_args, build = operator
+        args = expression[1:]
+        if not min_args <= len(args) <= max_args:
+            raise PredicateError(f"Wrong number of arguments of '{expression[0]}': {key}")
+
+        compute, depends_on = build(self, args)
+        node = self._nodes[key] = self._make_shared_node(compute, depends_on)
+        return node
+
+    def _make_shared_node(self, compute: typing.Callable[[], typing.Any], depends_on: Dependencies) -> Node:
+        slot = self._slot_count
+        self._slot_count += 1
+
+        def evaluate() -> typing.Any:
+            cycle = test_cache.get_cycle()
+            if cycle is None:
+                return compute()
+            if cycle != self._cycle:
+                self._cycle = cycle
+                self._values = {}
+            value = self._values.get(slot, _MISSING)
+            if value is _MISSING:
+                value = self._values[slot] = compute()
+            return value
+        return Node(evaluate, depends_on)
+
+
+BuildResult = typing.Tuple[typing.Callable[[], typing.Any], Dependencies]
+
+
+def _build_lookup(collection_name: str, id_type: str) -> typing.Callable[[Compiler, typing.List[typing.Any]], BuildResult]:
+    def build(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+        name_node = compiler.compile(args[0])
+        name = name_node.evaluate
+
+        def compute() -> typing.Any:
+            return getattr(bpy.data, collection_name).get(name(), None)
+        return compute, _union(name_node.depends_on, frozenset({id_type}))
+    return build
+
+
+def _build_material_of(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    obj_node = compiler.compile(args[0])
+    name_node = compiler.compile(args[1])
+    obj, name = obj_node.evaluate, name_node.evaluate
+
+    def compute() -> typing.Any:
+        materials = getattr(getattr(obj(), "data", None), "materials", None)
+        if materials is None:
+            return None
+        return materials.get(name(), None)
+    return compute, _union(obj_node.depends_on, name_node.depends_on, frozenset({'OBJECT', 'MESH', 'MATERIAL'}))
+
+
+# Attributes leading to other datablocks, reading them depends on those ID types too
+ATTRIBUTE_DEPENDENCIES: typing.Dict[str, typing.FrozenSet[str]] = {
+    "data": frozenset({'MESH', 'LIGHT', 'CAMERA'}),
+    "materials": frozenset({'MATERIAL'}),
+    "material_slots": frozenset({'MATERIAL'}),
+    "active_material": frozenset({'MATERIAL'}),
+    "node_tree": frozenset({'NODETREE'}),
+    "world": frozenset({'WORLD'}),
+    "camera": frozenset({'OBJECT', 'CAMERA'}),
+}
+
+
+def _build_attr(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    if not isinstance(args[1], str) or args[1] == "":
+        raise PredicateError(f"Attribute path has to be a string: {describe(args[1])}")
+    segments = args[1].split(".")
+    for segment in segments:
+        if segment.startswith("_"):
+            raise PredicateError(f"Private attributes can't be read: {args[1]}")
+    value_node = compiler.compile(args[0])
+    value_of = value_node.evaluate
+
+    def compute() -> typing.Any:
+        value = value_of()
+        for segment in segments:
+            if value is None:
+                return None
+            value = getattr(value, segment, None)
+        # Methods are never called, predicates only read data
+        return None if callable(value) else value
+
+    dependencies = [value_node.depends_on]
+    dependencies.extend(ATTRIBUTE_DEPENDENCIES.get(segment, frozenset()) for segment in segments)
+    return compute, _union(*dependencies)
+
+
+def _build_function(function: typing.Callable[..., typing.Any]) -> typing.Callable[[Compiler, typing.List[typing.Any]], BuildResult]:
+    """Operator applying 'function' to values of all arguments"""
+    def build(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+        nodes = [compiler.compile(arg) for arg in args]
+        evaluators = [node.evaluate for node in nodes]
+
+        def compute() -> typing.Any:
+            return function(*(evaluate() for evaluate in evaluators))
+        return compute, _union(*(node.depends_on for node in nodes))
+    return build
+
+
+def _build_and(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    nodes = [compiler.compile(arg) for arg in args]
+    evaluators = [node.evaluate for node in nodes]
+    return lambda: all(evaluate() for evaluate in evaluators), _union(*(node.depends_on for node in nodes))
+
+
+def _build_or(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    nodes = [compiler.compile(arg) for arg in args]
+    evaluators = [node.evaluate for node in nodes]
+    return lambda: any(evaluate() for evaluate in evaluators), _union(*(node.depends_on for node in nodes))
+
+
+def _build_literal(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    value = _freeze(args[0])
+    return lambda: value, frozenset()
+
+
+def _freeze(value: typing.Any) -> typing.Any:
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _build_node_query(compiler: Compiler, args: typing.List[typing.Any]) -> BuildResult:
+    if not isinstance(args[1], dict):
+        raise PredicateError(f"'node_query' needs a query object: {describe(args[1])}")
+    try:
+        query = node_query.compile_query(args[1])
+    except node_query.QueryError as e:
+        raise PredicateError(str(e)) from e
+    material_node = compiler.compile(args[0])
+    material_of = material_node.evaluate
+
+    def compute() -> bool:
+        material = material_of()
+        return isinstance(material, bpy.types.Material) and query.evaluate(material)
+    return compute, _union(material_node.depends_on, frozenset({'MATERIAL', 'NODETREE'}))
+
+
+def _compare(comparison: typing.Callable[[typing.Any, typing.Any], bool]) -> typing.Callable[[typing.Any, typing.Any], bool]:
+    def compare(a: typing.Any, b: typing.Any) -> bool:
+        try:
+            return bool(comparison(_plain(a), _plain(b)))
+        except TypeError:
+            # e.g. comparing None with a number
+            return False
+    return compare
+
+
+def _approx(a: typing.Any, b: typing.Any, tolerance: float = 1e-3) -> bool:
+    a, b = _plain(a), _plain(b)
+    if not isinstance(a, tuple):
+        a = (a, )
+    if not isinstance(b, tuple):
+        b = (b, )
+    try:
+        return len(a) == len(b) and all(abs(x - y) <= tolerance for x, y in zip(a, b))
+    except TypeError:
+        return False
+
+
+def _index(value: typing.Any, index: typing.Any) -> typing.Any:
+    try:
+        return value[index]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+def _len(value: typing.Any) -> typing.Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _contains(item: typing.Any, container: typing.Any) -> bool:
+    try:
+        return item in container
+    except TypeError:
+        return False
+
+
+_INFINITE = float("inf")
+
+# Operator name -> (min arguments, max arguments, build)
+OPERATORS: typing.Dict[str, typing.Tuple[int, float, typing.Callable[[Compiler, typing.List[typing.Any]], BuildResult]]] = {
+    "object": (1, 1, _build_lookup("objects", 'OBJECT')),
+    "mesh": (1, 1, _build_lookup("meshes", 'MESH')),
+    "material": (1, 1, _build_lookup("materials", 'MATERIAL')),
+    "light": (1, 1, _build_lookup("lights", 'LIGHT')),
+    "camera": (1, 1, _build_lookup("cameras", 'CAMERA')),
+    "world": (1, 1, _build_lookup("worlds", 'WORLD')),
+    "collection": (1, 1, _build_lookup("collections", 'COLLECTION')),
+    "image": (1, 1, _build_lookup("images", 'IMAGE')),
+    "material_of": (2, 2, _build_material_of),
+    "attr": (2, 2, _build_attr),
+    "index": (2, 2, _build_function(_index)),
+    "len": (1, 1, _build_function(_len)),
+    "exists": (1, 1, _build_function(lambda value: value is not None)),
+    "not": (1, 1, _build_function(lambda value: not value)),
+    "and": (1, _INFINITE, _build_and),
+    "or": (1, _INFINITE, _build_or),
+    "==": (2, 2, _build_function(_compare(lambda a, b: a == b))),
+    "!=": (2, 2, _build_function(_compare(lambda a, b: a != b))),
+    "<": (2, 2, _build_function(_compare(lambda a, b: a < b))),
+    "<=": (2, 2, _build_function(_compare(lambda a, b: a <= b))),
+    ">": (2, 2, _build_function(_compare(lambda a, b: a > b))),
+    ">=": (2, 2, _build_function(_compare(lambda a, b: a >= b))),
+    "approx": (2, 3, _build_function(_approx)),
+    "in": (2, 2, _build_function(_contains)),
+    "literal": (1, 1, _build_literal),
+    "node_query": (2, 2, _build_node_query),
+}
+
+
+def describe(expression: typing.Any, max_length: int = 60) -> str:
+    """Short text form of 'expression' for labels and error messages"""
+    text = json.dumps(expression, separators=(",", ":"))
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+def get_label(expression: typing.Any, max_length: int = 60) -> str:
+    """Label of the test of 'expression', the profiling name. Unlike the description it is
+    unique, truncated descriptions get a hash of the whole expression.
+    """
+    if len(json.dumps(expression, separators=(",", ":"))) <= max_length:
+        return describe(expression, max_length)
+    canonical = json.dumps(expression, separators=(",", ":"), sort_keys=True)
+    return f"{describe(expression, max_length)}#{hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:10]}"
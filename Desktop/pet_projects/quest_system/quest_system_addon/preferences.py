@@ -21,14 +21,17 @@
 
 import os
 import bpy
+import heapq
 import typing
 
 
 if "polib" not in locals():
     import polib
+    from . import profiling
 else:
     import importlib
     polib = importlib.reload(polib)
+    profiling = importlib.reload(profiling)
 
 
 telemetry = polib.get_telemetry("quest_system")
@@ -38,6 +41,11 @@ MODULE_CLASSES: typing.List[typing.Type] = []
 
 
 class StepProperties(bpy.types.PropertyGroup):
+    # Id of the loader.Step, names don't have to be unique
+    step_id: bpy.props.StringProperty(
+        name="Step ID",
+        default=""
+    )
     name: bpy.props.StringProperty(
         name="Name",
         default=""
@@ -46,11 +54,28 @@ class StepProperties(bpy.types.PropertyGroup):
         name="Description",
         default=""
     )
+    # Steps are unlocked when all steps they require are completed
+    state: bpy.props.EnumProperty(
+        name="State",
+        default='LOCKED',
+        items=(
+            ('LOCKED', "Locked", "Some of the steps this step requires aren't completed yet"),
+            ('AVAILABLE', "Available", "Step can be completed now"),
+            ('COMPLETED', "Completed", "Step was completed")
+        )
+    )
 
 
 MODULE_CLASSES.append(StepProperties)
 
 
+# Indices of steps of Preferences.task which are unlocked but not completed and of completed
+# steps, by step id. Kept up to date by TaskProperties.set_step_state, so drawing, checking and
+# completing don't go through all steps in RNA. None until needed for the first time.
+_frontier: typing.Optional[typing.Dict[str, int]] = None
+_completed: typing.Optional[typing.Dict[str, int]] = None
+
+
 class TaskProperties(bpy.types.PropertyGroup):
     name: bpy.props.StringProperty(
         name="Name",
@@ -63,24 +88,72 @@ class TaskProperties(bpy.types.PropertyGroup):
     steps: bpy.props.CollectionProperty(
         type=StepProperties
     )
-    current_step: bpy.props.IntProperty(
-        name="Current Step",
-        min=0,
+    # Active item of the steps UI list, not related to the progress
+    steps_index: bpy.props.IntProperty(
         default=0
     )
 
     def is_finished(self) -> bool:
-        return self.current_step >= len(self.steps)
-
-    def get_current_step(self) -> typing.Optional[StepProperties]:
-        if self.current_step < 0 or self.current_step >= len(self.steps):
-            return None
-        return self.steps[self.current_step]
+        if _completed is None:
+            self.update_step_states()
+        return len(_completed) == len(self.steps)
+
+    def get_completed_step_ids(self) -> typing.List[str]:
+        """Returns ids of completed steps in the order of steps"""
+        if _completed is None:
+            self.update_step_states()
+        return sorted(_completed, key=_completed.__getitem__)
+
+    def get_frontier(self, limit: typing.Optional[int] = None) -> typing.List[StepProperties]:
+        """Returns steps which are unlocked but not completed yet, the first 'limit' of them if given"""
+        if _frontier is None:
+            self.update_step_states()
+        indices = sorted(_frontier.values()) if limit is None else heapq.nsmallest(limit, _frontier.values())
+        steps = self.steps
+        return [steps[i] for i in indices]
+
+    def get_frontier_size(self) -> int:
+        if _frontier is None:
+            self.update_step_states()
+        return len(_frontier)
+
+    def update_step_states(self) -> None:
+        """Reads states of all steps again, needed after steps were added, removed or reordered"""
+        global _frontier
+        global _completed
+        _frontier = {}
+        _completed = {}
+        for i, step in enumerate(self.steps):
+            if step.state == 'AVAILABLE':
+                _frontier[step.step_id] = i
+            elif step.state == 'COMPLETED':
+                _completed[step.step_id] = i
+
+    def set_step_state(self, index: int, state: str) -> None:
+        step = self.steps[index]
+        if step.state != state:
+            step.state = state
+        if _frontier is None or _completed is None:
+            return
+        _frontier.pop(step.step_id, None)
+        _completed.pop(step.step_id, None)
+        if state == 'AVAILABLE':
+            _frontier[step.step_id] = index
+        elif state == 'COMPLETED':
+            _completed[step.step_id] = index
 
 
 MODULE_CLASSES.append(TaskProperties)
 
 
+class TaskListItem(bpy.types.PropertyGroup):
+    # Only the inherited name, the collection exists so the quests can be drawn by a UI list
+    pass
+
+
+MODULE_CLASSES.append(TaskListItem)
+
+
 class Preferences(bpy.types.AddonPreferences):
     bl_idname = __package__
 
@@ -98,7 +171,38 @@ class Preferences(bpy.types.AddonPreferences):
         )
     )
 
+    search_query: bpy.props.StringProperty(
+        name="Search",
+        description="Show tasks of all difficulties whose name, description or steps contain "
+        "these words, words can be incomplete",
+        options={'TEXTEDIT_UPDATE'}
+    )
+
+    available_tasks: bpy.props.CollectionProperty(
+        type=TaskListItem
+    )
+    available_tasks_index: bpy.props.IntProperty(
+        default=0
+    )
+
+    auto_check: bpy.props.BoolProperty(
+        name="Check Automatically",
+        description="Check the current step whenever something it depends on changes",
+        default=True
+    )
+
+    authoring_mode: bpy.props.BoolProperty(
+        name="Quest Authoring Mode",
+        description="Reload quest files whenever they change on disk, the task in progress keeps "
+        "its progress",
+        default=False
+    )
+
     def draw(self, context):
+        row = self.layout.row()
+        row.prop(self, "auto_check")
+        row = self.layout.row()
+        row.prop(self, "authoring_mode")
         row = self.layout.row()
         row.operator(CopyTelemetry.bl_idname, icon='EXPERIMENTAL')
 
@@ -122,7 +226,8 @@ class CopyTelemetry(bpy.types.Operator):
     bl_options = {'REGISTER'}
 
     def execute(self, context):
-        context.window_manager.clipboard = telemetry.dump()
+        context.window_manager.clipboard = \
+            f"{telemetry.dump()}\n\nquest_system performance:\n{profiling.dump()}"
 
         return {'FINISHED'}
 
@@ -137,5 +242,9 @@ def register():
 
 
 def unregister():
+    global _frontier
+    global _completed
+    _frontier = None
+    _completed = None
     for cls in reversed(MODULE_CLASSES):
         bpy.utils.unregister_class(cls)
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Timings of step tests, scene preparation and panel draws, included in the telemetry dump so bug
+# reports tell us what is slow. Everything is kept in memory with a fixed upper bound, the least
+# recently updated entries are dropped first.
+
+import json
+import time
+import heapq
+import typing
+import contextlib
+import collections
+
+
+MAX_ENTRIES = 512
+MAX_SLOWEST_SAMPLES = 32
+
+
+class Stats:
+    __slots__ = ("count", "total", "max", "passed", "failed")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Only counted for entries with a result, e.g. tests
+        self.passed = 0
+        self.failed = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        data = {
+            "count": self.count,
+            "total_ms": round(self.total * 1000.0, 3),
+            "mean_ms": round(self.mean * 1000.0, 3),
+            "max_ms": round(self.max * 1000.0, 3),
+        }
+        if self.passed + self.failed > 0:
+            data["pass_ratio"] = round(self.passed / (self.passed + self.failed), 3)
+        return data
+
+
+_stats: typing.OrderedDict[str, Stats] = collections.OrderedDict()
+# Min-heap of (duration, name, time) so the fastest of the kept samples is dropped first
+_slowest: typing.List[typing.Tuple[float, str, float]] = []
+
+
+def record(name: str, duration: float, result: typing.Optional[bool] = None) -> None:
+    stats = _stats.get(name, None)
+    if stats is None:
+        if len(_stats) >= MAX_ENTRIES:
+            _stats.popitem(last=False)
+        stats = _stats[name] = Stats()
+    else:
+        _stats.move_to_end(name)
+
+    stats.count += 1
+    stats.total += duration
+    stats.max = max(stats.max, duration)
+    if result is not None:
+        if result:
+            stats.passed += 1
+        else:
+            stats.failed += 1
+
+    sample = (duration, name, time.time())
+    if len(_slowest) < MAX_SLOWEST_SAMPLES:
+        heapq.heappush(_slowest, sample)
+    elif duration > _slowest[0][0]:
+        heapq.heapreplace(_slowest, sample)
+
+
+@contextlib.contextmanager
+def measure(name: str) -> typing.Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def run_test(name: str, test: typing.Callable[[], bool]) -> bool:
+    start = time.perf_counter()
+    result = bool(test())
+    record(name, time.perf_counter() - start, result)
+    return result
+
+
+def get_stats(name: str) -> typing.Optional[Stats]:
+    return _stats.get(name, None)
+
+
+def reset() -> None:
+    _stats.clear()
+    _slowest.clear()
+
+
+def dump() -> str:
+    return json.dumps({
+        "stats": {name: stats.to_dict() for name, stats in _stats.items()},
+        "slowest": [
+            {"name": name, "ms": round(duration * 1000.0, 3), "time": timestamp}
+            for duration, name, timestamp in sorted(_slowest, reverse=True)
+        ]
+    }, indent=2)
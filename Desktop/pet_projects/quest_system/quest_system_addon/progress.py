@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Progress of the task in progress persisted across Blender sessions. Starting a task stamps the
+# scene with a random session token, the fingerprint of the scene is derived from it. When the
+# open file still has a scene with the same fingerprint, the task is resumed without preparing
+# the scene again.
+
+import os
+import bpy
+import json
+import uuid
+import typing
+import hashlib
+import logging
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+SESSION_PROPERTY = "quest_system_session"
+PROGRESS_FILENAME = "progress.json"
+
+
+class ProgressRecord:
+    __slots__ = ("task_id", "completed_steps", "fingerprint")
+
+    def __init__(self, task_id: str, completed_steps: typing.List[str], fingerprint: str) -> None:
+        self.task_id = task_id
+        # Ids of completed steps, steps can be completed in any order their requirements allow
+        self.completed_steps = completed_steps
+        self.fingerprint = fingerprint
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "task_id": self.task_id,
+            "completed_steps": self.completed_steps,
+            "fingerprint": self.fingerprint
+        }
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any]) -> 'ProgressRecord':
+        # Records written before steps could be completed out of order have no completed steps
+        return cls(data["task_id"], list(data.get("completed_steps", [])), data["fingerprint"])
+
+
+# None until the record file is read for the first time
+_record: typing.Optional[ProgressRecord] = None
+_record_read = False
+
+
+def _get_progress_path() -> str:
+    config_path = bpy.utils.user_resource('CONFIG', path="quest_system", create=True)
+    return os.path.join(config_path, PROGRESS_FILENAME)
+
+
+def stamp_scene(scene: bpy.types.Scene) -> str:
+    scene[SESSION_PROPERTY] = uuid.uuid4().hex
+    return get_fingerprint(scene)
+
+
+def get_fingerprint(scene: bpy.types.Scene) -> typing.Optional[str]:
+    token = scene.get(SESSION_PROPERTY, None)
+    if token is None:
+        return None
+    return hashlib.sha1(f"{scene.name}:{token}".encode("utf-8")).hexdigest()
+
+
+def read_record() -> typing.Optional[ProgressRecord]:
+    global _record
+    global _record_read
+    if _record_read:
+        return _record
+
+    _record_read = True
+    try:
+        with open(_get_progress_path(), encoding="utf-8") as f:
+            _record = ProgressRecord.from_dict(json.load(f))
+    except FileNotFoundError:
+        _record = None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Couldn't read quest progress: {e}")
+        _record = None
+    return _record
+
+
+def write_record(record: ProgressRecord) -> None:
+    global _record
+    global _record_read
+    _record = record
+    _record_read = True
+    try:
+        with open(_get_progress_path(), "w", encoding="utf-8") as f:
+            json.dump(record.to_dict(), f, separators=(",", ":"))
+    except OSError as e:
+        logger.warning(f"Couldn't write quest progress: {e}")
+
+
+def update_completed_steps(completed_steps: typing.List[str]) -> None:
+    record = read_record()
+    if record is None or record.completed_steps == completed_steps:
+        return
+    write_record(ProgressRecord(record.task_id, completed_steps, record.fingerprint))
+
+
+def find_matching_record(scene: bpy.types.Scene) -> typing.Optional[ProgressRecord]:
+    record = read_record()
+    if record is None or record.fingerprint != get_fingerprint(scene):
+        return None
+    return record
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Compares a small preview render of the scene with a reference image shipped with the quest,
+# for lighting and look-dev steps where checking individual properties is too brittle. The
+# preview is rendered by Cycles on CPU with a few samples, so it works headless too. Both images
+# are downsampled to DIFF_SIZE x DIFF_SIZE by averaging and compared by their mean absolute
+# difference. References are decoded once, when the task starts. The render is skipped when
+# nothing it depends on changed since the last comparison.
+
+import os
+import bpy
+import numpy
+import typing
+import logging
+import tempfile
+import contextlib
+
+
+if "catalog" not in locals():
+    from . import catalog
+    from . import test_cache
+else:
+    import importlib
+    catalog = importlib.reload(catalog)
+    test_cache = importlib.reload(test_cache)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+TestLambda = typing.Callable[[], bool]
+
+
+DIFF_SIZE = 32
+# SCENE and IMAGE are left out on purpose, rendering the preview changes render settings and
+# loads images and would invalidate itself. Texture swaps still show up as NODETREE changes.
+RENDER_DEPENDENCIES = ('OBJECT', 'MESH', 'MATERIAL', 'NODETREE', 'LIGHT', 'CAMERA', 'WORLD')
+
+
+class ReferenceImage:
+    def __init__(self, pixels: numpy.ndarray) -> None:
+        height, width = pixels.shape[:2]
+        # Preview is rendered with the aspect ratio of the reference
+        self.aspect = height / width if width > 0 else 1.0
+        self.downsampled = downsample(pixels, DIFF_SIZE)
+
+
+_references: typing.Dict[str, ReferenceImage] = {}
+
+
+def read_image_pixels(path: str) -> typing.Optional[numpy.ndarray]:
+    """Decodes image at 'path' to a (height, width, 3) float array"""
+    try:
+        image = bpy.data.images.load(path, check_existing=False)
+    except RuntimeError as e:
+        logger.error(f"Couldn't load image '{path}': {e}")
+        return None
+    try:
+        width, height = image.size
+        channels = image.channels
+        pixels = numpy.empty(width * height * channels, dtype=numpy.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+    pixels = pixels.reshape(height, width, channels)
+    if channels < 3:
+        return numpy.repeat(pixels[:, :, :1], 3, axis=2)
+    return pixels[:, :, :3]
+
+
+def downsample(pixels: numpy.ndarray, size: int) -> numpy.ndarray:
+    """Averages 'pixels' into 'size' x 'size' blocks"""
+    if pixels.shape[0] == 0 or pixels.shape[1] == 0:
+        return numpy.zeros((size, size, pixels.shape[2]), dtype=numpy.float32)
+    rows = numpy.linspace(0, pixels.shape[0], size + 1).astype(int)
+    cols = numpy.linspace(0, pixels.shape[1], size + 1).astype(int)
+    # Images smaller than 'size' have empty blocks, reduceat then picks the single pixel
+    rows[:-1] = numpy.minimum(rows[:-1], pixels.shape[0] - 1)
+    cols[:-1] = numpy.minimum(cols[:-1], pixels.shape[1] - 1)
+    sums = numpy.add.reduceat(numpy.add.reduceat(pixels, rows[:-1], axis=0), cols[:-1], axis=1)
+    counts = numpy.outer(numpy.maximum(numpy.diff(rows), 1), numpy.maximum(numpy.diff(cols), 1))
+    return sums / counts[:, :, numpy.newaxis]
+
+
+def image_difference(a: numpy.ndarray, b: numpy.ndarray) -> float:
+    return float(numpy.abs(a - b).mean())
+
+
+def get_reference(path: str) -> typing.Optional[ReferenceImage]:
+    reference = _references.get(path, None)
+    if reference is not None:
+        return reference
+    pixels = read_image_pixels(path)
+    if pixels is None:
+        return None
+    reference = _references[path] = ReferenceImage(pixels)
+    return reference
+
+
+@contextlib.contextmanager
+def _overridden(owner: typing.Any, **values: typing.Any) -> typing.Iterator[None]:
+    original = {name: getattr(owner, name) for name in values}
+    try:
+        for name, value in values.items():
+            setattr(owner, name, value)
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(owner, name, value)
+
+
+def render_preview(scene: bpy.types.Scene, width: int, height: int, samples: int) -> typing.Optional[numpy.ndarray]:
+    """Renders the scene camera by Cycles on CPU, returns (height, width, 3) pixels"""
+    if scene.camera is None:
+        logger.warning(f"Scene '{scene.name}' has no camera, can't render preview")
+        return None
+
+    path = os.path.join(tempfile.gettempdir(), f"quest_system_preview_{os.getpid()}.png")
+    render = scene.render
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(_overridden(
+            render, engine='CYCLES', resolution_x=width, resolution_y=height, resolution_percentage=100,
+            film_transparent=False))
+        stack.enter_context(_overridden(
+            render.image_settings, file_format='PNG', color_mode='RGB', color_depth='8'))
+        stack.enter_context(_overridden(scene.cycles, device='CPU', samples=samples, use_denoising=False))
+        bpy.ops.render.render(scene=scene.name)
+        bpy.data.images["Render Result"].save_render(path, scene=scene)
+
+    try:
+        return read_image_pixels(path)
+    finally:
+        os.remove(path)
+
+
+def render_matches_reference(
+    reference_file: str,
+    tolerance: float = 0.05,
+    resolution: int = 64,
+    samples: int = 4
+) -> TestLambda:
+    """Preview render differs from the reference by at most 'tolerance' (0 - 1) on average"""
+    path = os.path.join(catalog.QUESTS_PATH, reference_file)
+    # (change key, result) of the last comparison
+    last_comparison: typing.Optional[typing.Tuple[typing.Tuple[typing.Any, ...], bool]] = None
+
+    def test() -> bool:
+        nonlocal last_comparison
+        reference = get_reference(path)
+        if reference is None:
+            return False
+
+        scene = bpy.context.scene
+        # Camera and world are assigned in the scene, which isn't part of the version key
+        key = test_cache.get_version_key(RENDER_DEPENDENCIES) + (
+            scene.name,
+            scene.camera.name if scene.camera is not None else None,
+            scene.world.name if scene.world is not None else None)
+        if last_comparison is not None and last_comparison[0] == key:
+            return last_comparison[1]
+
+        pixels = render_preview(
+            scene, resolution, max(1, round(resolution * reference.aspect)), samples)
+        result = pixels is not None and \
+            image_difference(downsample(pixels, DIFF_SIZE), reference.downsampled) <= tolerance
+        last_comparison = (key, result)
+        return result
+
+    # Decoding the reference doesn't have to wait for the first check
+    test.on_task_start = lambda: get_reference(path)
+    return test
+
+
+def clear_cache() -> None:
+    _references.clear()
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Keeps repeated task (re)starts from leaking datablocks. Datablocks existing before the first task
+# of the file was prepared form the baseline. Every following start removes all datablocks
+# created since then, by the quest or by the learner, in one batch_remove and purges orphans the
+# removal left behind. Memory and datablock counts before and after are logged and kept in the
+# last report, classroom machines run the same quest all day.
+
+import os
+import sys
+import bpy
+import time
+import typing
+import logging
+
+
+if "templates" not in locals():
+    from . import templates
+    from . import profiling
+else:
+    import importlib
+    templates = importlib.reload(templates)
+    profiling = importlib.reload(profiling)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+# bpy.data collections of datablocks quests and learners create. Collections missing in the
+# running Blender version are skipped.
+TRACKED_COLLECTIONS = (
+    "scenes",
+    "objects",
+    "collections",
+    "meshes",
+    "curves",
+    "metaballs",
+    "fonts",
+    "armatures",
+    "lattices",
+    "grease_pencils",
+    "cameras",
+    "lights",
+    "lightprobes",
+    "speakers",
+    "volumes",
+    "pointclouds",
+    "hair_curves",
+    "materials",
+    "node_groups",
+    "textures",
+    "images",
+    "worlds",
+    "particles",
+    "actions",
+)
+# Removing orphans can orphan other datablocks (e.g. materials of a mesh), a few passes are enough
+MAX_PURGE_PASSES = 8
+
+
+class RestoreReport:
+    __slots__ = ("removed", "purged", "datablocks_before", "datablocks_after", "memory_before", "memory_after")
+
+    def __init__(self) -> None:
+        self.removed = 0
+        self.purged = 0
+        self.datablocks_before = 0
+        self.datablocks_after = 0
+        # Resident memory of Blender in bytes, None where we can't measure it
+        self.memory_before: typing.Optional[int] = None
+        self.memory_after: typing.Optional[int] = None
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# Ids of datablocks in the baseline, None until the first task of the file is prepared
+_baseline: typing.Optional[typing.Set[int]] = None
+_last_report: typing.Optional[RestoreReport] = None
+
+
+def _get_id(datablock: bpy.types.ID) -> int:
+    # session_uid is never reused within a session, pointers of removed datablocks can be.
+    # Blender before 2.91 only has pointers, a reused pointer keeps one datablock alive at worst.
+    session_uid = getattr(datablock, "session_uid", None)
+    return session_uid if session_uid is not None else datablock.as_pointer()
+
+
+def _iter_datablocks() -> typing.Iterator[bpy.types.ID]:
+    for collection_name in TRACKED_COLLECTIONS:
+        collection = getattr(bpy.data, collection_name, None)
+        if collection is not None:
+            yield from collection
+
+
+def is_protected(datablock: bpy.types.ID) -> bool:
+    # Linked asset libraries are reused by following tasks
+    if templates.is_template_datablock(datablock) or datablock.library is not None:
+        return True
+    if isinstance(datablock, bpy.types.Scene):
+        return datablock == bpy.context.scene
+    if isinstance(datablock, bpy.types.Image):
+        # Render Result and Viewer Node images are owned by Blender
+        return datablock.type in {'RENDER_RESULT', 'COMPOSITING'}
+    return False
+
+
+def count_datablocks() -> int:
+    return sum(len(getattr(bpy.data, name)) for name in TRACKED_COLLECTIONS if hasattr(bpy.data, name))
+
+
+def get_memory_usage() -> typing.Optional[int]:
+    """Returns resident memory of this process in bytes, None if unknown on this platform"""
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+    if sys.platform == "win32":
+        import ctypes
+        import ctypes.wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.wintypes.DWORD),
+                ("PageFaultCount", ctypes.wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    return None
+
+
+def has_baseline() -> bool:
+    return _baseline is not None
+
+
+def record_baseline() -> None:
+    global _baseline
+    _baseline = {_get_id(datablock) for datablock in _iter_datablocks()}
+
+
+def clear_baseline() -> None:
+    global _baseline
+    _baseline = None
+
+
+def purge_orphans() -> int:
+    """Removes datablocks nothing uses, except fake users and templates. Returns their count."""
+    purged = 0
+    for _ in range(MAX_PURGE_PASSES):
+        orphans = [
+            datablock for datablock in _iter_datablocks()
+            # Scenes without users are still shown in the scene selector, never purge them
+            if datablock.users == 0 and not datablock.use_fake_user and not is_protected(datablock)
+            and not isinstance(datablock, bpy.types.Scene)
+        ]
+        if len(orphans) == 0:
+            break
+        bpy.data.batch_remove(ids=orphans)
+        purged += len(orphans)
+    return purged
+
+
+def restore() -> typing.Optional[RestoreReport]:
+    """Removes everything created since the baseline was recorded, None if there is no baseline"""
+    global _last_report
+    if _baseline is None:
+        return None
+
+    start = time.perf_counter()
+    report = RestoreReport()
+    report.memory_before = get_memory_usage()
+    report.datablocks_before = count_datablocks()
+    created = [
+        datablock for datablock in _iter_datablocks()
+        if _get_id(datablock) not in _baseline and not is_protected(datablock)
+    ]
+    if len(created) > 0:
+        bpy.data.batch_remove(ids=created)
+    report.removed = len(created)
+    report.purged = purge_orphans()
+    # Forget removed baseline datablocks, their pointers could be reused by new datablocks
+    _baseline.intersection_update(_get_id(datablock) for datablock in _iter_datablocks())
+    report.datablocks_after = count_datablocks()
+    report.memory_after = get_memory_usage()
+    profiling.record("sandbox:restore", time.perf_counter() - start)
+
+    memory_text = ""
+    if report.memory_before is not None and report.memory_after is not None:
+        memory_text = f", memory {report.memory_before / 2**20:.1f} MiB -> {report.memory_after / 2**20:.1f} MiB"
+    logger.info(
+        f"Sandbox restored, removed {report.removed} created and {report.purged} orphaned datablocks, "
+        f"datablocks {report.datablocks_before} -> {report.datablocks_after}{memory_text}")
+    _last_report = report
+    return report
+
+
+def enter() -> None:
+    """Called before a task prepares the scene, restores the sandbox or records the baseline"""
+    if has_baseline():
+        restore()
+    else:
+        record_baseline()
+
+
+def get_last_report() -> typing.Optional[RestoreReport]:
+    return _last_report
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    global _last_report
+    # Datablocks of another file, its first task records a new baseline
+    clear_baseline()
+    _last_report = None
+
+
+def register():
+    bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(_load_post)
+    clear_baseline()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Full-text search of tasks. An inverted index maps every word of task names, descriptions and
+# step texts to the tasks containing it, weighted by where the word is. Query words match
+# indexed words they are a prefix of, found by bisecting the sorted vocabulary, so a query only
+# touches the postings of matching words, never all tasks. A task has to match every query word.
+# Its score is the sum over query words of the best weight * idf of a matching word, prefix
+# matches count less the more characters they miss. The index is kept up to date by the catalog.
+
+import math
+import bisect
+import typing
+import collections
+
+
+if "catalog" not in locals():
+    from . import catalog
+else:
+    import importlib
+    catalog = importlib.reload(catalog)
+
+
+# Term weights by item, e.g. {"bevel": 3.0, "edges": 1.0}
+GetTermsLambda = typing.Callable[[typing.Any], typing.Dict[str, float]]
+
+
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.5
+STEP_WEIGHT = 1.0
+PREFIX_MATCH_FACTOR = 0.5
+MAX_CACHED_QUERIES = 64
+
+
+def get_weighted_terms(fields: typing.Iterable[typing.Tuple[typing.Iterable[str], float]]) -> typing.Dict[str, float]:
+    """Returns the highest weight of each term among (terms, weight) fields"""
+    weighted_terms: typing.Dict[str, float] = {}
+    for terms, weight in fields:
+        for term in terms:
+            if weighted_terms.get(term, 0.0) < weight:
+                weighted_terms[term] = weight
+    return weighted_terms
+
+
+class SearchIndex:
+    def __init__(self, get_terms: GetTermsLambda) -> None:
+        self._get_terms = get_terms
+        # Weights of the term by item name
+        self._postings: typing.Dict[str, typing.Dict[str, float]] = {}
+        self._terms_by_name: typing.Dict[str, typing.Tuple[str, ...]] = {}
+        # Sorted vocabulary for prefix lookups, None until the first search after a bulk build
+        self._sorted_terms: typing.Optional[typing.List[str]] = None
+        # Results of recent queries, typing a query repeats its prefixes
+        self._results: typing.OrderedDict[str, typing.List[str]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._terms_by_name)
+
+    def add(self, item: typing.Any) -> None:
+        if item.name in self._terms_by_name:
+            self.remove(item.name)
+        weighted_terms = self._get_terms(item)
+        for term, weight in weighted_terms.items():
+            postings = self._postings.get(term, None)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._sorted_terms is not None:
+                    bisect.insort(self._sorted_terms, term)
+            postings[item.name] = weight
+        self._terms_by_name[item.name] = tuple(weighted_terms)
+        self._results.clear()
+
+    def remove(self, name: str) -> None:
+        terms = self._terms_by_name.pop(name, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[name]
+            if len(postings) == 0:
+                del self._postings[term]
+                if self._sorted_terms is not None:
+                    del self._sorted_terms[bisect.bisect_left(self._sorted_terms, term)]
+        self._results.clear()
+
+    def _iter_matching_terms(self, token: str) -> typing.Iterator[str]:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        i = bisect.bisect_left(self._sorted_terms, token)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(token):
+            yield self._sorted_terms[i]
+            i += 1
+
+    def _score_token(self, token: str) -> typing.Dict[str, float]:
+        scores: typing.Dict[str, float] = {}
+        for term in self._iter_matching_terms(token):
+            postings = self._postings[term]
+            idf = math.log(1.0 + len(self._terms_by_name) / len(postings))
+            factor = 1.0 if term == token else PREFIX_MATCH_FACTOR * len(token) / len(term)
+            for name, weight in postings.items():
+                score = weight * idf * factor
+                if scores.get(name, 0.0) < score:
+                    scores[name] = score
+        return scores
+
+    def search(self, query: str, limit: typing.Optional[int] = None) -> typing.List[str]:
+        """Returns names of items matching all words of 'query', best first"""
+        tokens = sorted(set(catalog.tokenize(query)))
+        if len(tokens) == 0:
+            return []
+        key = " ".join(tokens)
+        results = self._results.get(key, None)
+        if results is None:
+            results = self._search(tokens)
+            if len(self._results) >= MAX_CACHED_QUERIES:
+                self._results.popitem(last=False)
+            self._results[key] = results
+        else:
+            self._results.move_to_end(key)
+        return results[:limit] if limit is not None else list(results)
+
+    def _search(self, tokens: typing.List[str]) -> typing.List[str]:
+        # Longest tokens tend to match the fewest items, the intersection shrinks fastest
+        scores: typing.Optional[typing.Dict[str, float]] = None
+        for token in sorted(tokens, key=len, reverse=True):
+            token_scores = self._score_token(token)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {name: score + token_scores[name] for name, score in scores.items() if name in token_scores}
+            if len(scores) == 0:
+                return []
+        return sorted(scores, key=lambda name: (-scores[name], name))
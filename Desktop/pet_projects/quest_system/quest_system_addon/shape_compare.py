@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Compares the shape of the learner's object with a reference mesh shipped with the quest. The
+# reference is a .npy file with vertex coordinates (N x 3, object space). The shapes match if the
+# symmetric Hausdorff distance of the vertex sets is within tolerance. Points are bucketed into a
+# grid of cells at least as big as the tolerance, so the neighbours of a point within tolerance
+# are in the 27 cells around it. Queries are vectorized over chunks of points, numpy releases the
+# GIL in its inner loops, and stop at the first chunk with a point further than the tolerance.
+# Grid of the reference is built once per tolerance and cached. The comparison runs in a worker
+# thread, see background_check, only reading the vertices and loading the reference happens on
+# the main thread.
+
+import os
+import numpy
+import typing
+import logging
+
+
+if "geometry" not in locals():
+    from . import catalog
+    from . import geometry
+    from . import test_cache
+    from . import background_check
+else:
+    import importlib
+    catalog = importlib.reload(catalog)
+    geometry = importlib.reload(geometry)
+    test_cache = importlib.reload(test_cache)
+    background_check = importlib.reload(background_check)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+TestLambda = typing.Callable[[], bool]
+
+
+# Keys of cells have to fit into int64, bigger grids get bigger cells
+MAX_CELLS_PER_AXIS = 1 << 20
+MIN_CELL_SIZE = 1e-6
+# Points queried at once and (point, candidate) pairs compared at once, bound temporary arrays
+QUERY_CHUNK_SIZE = 4096
+MAX_CANDIDATES_PER_CHUNK = 1 << 20
+# The cell of a point first, most points have their neighbour there, then the 26 cells around it
+_OWN_CELL_OFFSET = numpy.zeros((1, 3), dtype=numpy.int64)
+_NEIGHBOUR_OFFSETS = numpy.array(
+    [(x, y, z) for z in (-1, 0, 1) for y in (-1, 0, 1) for x in (-1, 0, 1) if (x, y, z) != (0, 0, 0)],
+    dtype=numpy.int64
+)
+
+class PointGrid:
+    """Points bucketed into cubic cells, finds whether points have a neighbour within 'tolerance'"""
+
+    def __init__(self, coords: numpy.ndarray, tolerance: float) -> None:
+        self.tolerance = tolerance
+        self.origin = coords.min(axis=0)
+        extent = float((coords.max(axis=0) - self.origin).max())
+        self.cell_size = max(tolerance, extent / (MAX_CELLS_PER_AXIS - 1), MIN_CELL_SIZE)
+        cells = self._get_cells(coords)
+        self.shape = cells.max(axis=0) + 1
+        keys = self._get_keys(cells)
+        order = numpy.argsort(keys, kind="stable")
+        self.coords = coords[order]
+        self.keys, self.starts, self.counts = numpy.unique(keys[order], return_index=True, return_counts=True)
+
+    def _get_cells(self, coords: numpy.ndarray) -> numpy.ndarray:
+        return numpy.floor((coords - self.origin) / self.cell_size).astype(numpy.int64)
+
+    def _get_keys(self, cells: numpy.ndarray) -> numpy.ndarray:
+        return cells[..., 0] + self.shape[0] * (cells[..., 1] + self.shape[1] * cells[..., 2])
+
+    def _find_cells(self, cells: numpy.ndarray) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        """Returns (starts, counts) of points in 'cells', counts are 0 for empty cells"""
+        inside = numpy.all((cells >= 0) & (cells < self.shape), axis=-1)
+        keys = self._get_keys(numpy.where(inside[..., numpy.newaxis], cells, 0))
+        positions = numpy.minimum(numpy.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = inside & (self.keys[positions] == keys)
+        return self.starts[positions], numpy.where(found, self.counts[positions], 0)
+
+    def _find_within(self, points: numpy.ndarray, offsets: numpy.ndarray) -> numpy.ndarray:
+        """Returns mask of 'points' with a point within tolerance in cells at 'offsets' from theirs"""
+        starts, counts = self._find_cells(self._get_cells(points)[:, numpy.newaxis, :] + offsets)
+        # Flattened (point, cell) pairs of non-empty cells
+        point_indices, cell_indices = numpy.nonzero(counts)
+        starts = starts[point_indices, cell_indices]
+        counts = counts[point_indices, cell_indices]
+        ends = numpy.cumsum(counts)
+        # Pairs are compared in batches of about MAX_CANDIDATES_PER_CHUNK candidates
+        splits = numpy.searchsorted(
+            ends, numpy.arange(MAX_CANDIDATES_PER_CHUNK, ends[-1] if len(ends) > 0 else 0, MAX_CANDIDATES_PER_CHUNK))
+        found = numpy.zeros(len(points), dtype=bool)
+        max_squared_distance = self.tolerance * self.tolerance
+        for batch in numpy.split(numpy.arange(len(counts)), splits):
+            if len(batch) == 0:
+                continue
+            batch_counts = counts[batch]
+            batch_offsets = numpy.cumsum(batch_counts) - batch_counts
+            candidates = numpy.repeat(starts[batch] - batch_offsets, batch_counts) + \
+                numpy.arange(int(batch_counts.sum()))
+            queries = numpy.repeat(point_indices[batch], batch_counts)
+            delta = self.coords[candidates] - points[queries]
+            within = numpy.einsum("ij,ij->i", delta, delta) <= max_squared_distance
+            found[queries[within]] = True
+        return found
+
+    def _chunk_within(self, points: numpy.ndarray) -> bool:
+        found = self._find_within(points, _OWN_CELL_OFFSET)
+        missing = points[~found]
+        return len(missing) == 0 or bool(self._find_within(missing, _NEIGHBOUR_OFFSETS).all())
+
+    def all_within(self, points: numpy.ndarray) -> bool:
+        """Every point of 'points' has a point of the grid within tolerance"""
+        for start in range(0, len(points), QUERY_CHUNK_SIZE):
+            if not self._chunk_within(points[start:start + QUERY_CHUNK_SIZE]):
+                return False
+        return True
+
+
+class ReferenceShape:
+    def __init__(self, coords: numpy.ndarray) -> None:
+        self.coords = coords
+        self.bounds_min = coords.min(axis=0) if len(coords) > 0 else numpy.zeros(3)
+        self.bounds_max = coords.max(axis=0) if len(coords) > 0 else numpy.zeros(3)
+        self._grids: typing.Dict[float, PointGrid] = {}
+
+    def get_grid(self, tolerance: float) -> PointGrid:
+        # Built in worker threads, a race only builds the same grid twice
+        grid = self._grids.get(tolerance, None)
+        if grid is None:
+            grid = self._grids[tolerance] = PointGrid(self.coords, tolerance)
+        return grid
+
+
+_references: typing.Dict[str, ReferenceShape] = {}
+
+
+def get_reference(path: str) -> typing.Optional[ReferenceShape]:
+    reference = _references.get(path, None)
+    if reference is not None:
+        return reference
+
+    try:
+        coords = numpy.load(path).astype(numpy.float32).reshape(-1, 3)
+    except (OSError, ValueError) as e:
+        logger.error(f"Couldn't load reference shape '{path}': {e}")
+        return None
+    reference = _references[path] = ReferenceShape(coords)
+    return reference
+
+
+def _subsample(coords: numpy.ndarray, max_samples: int) -> numpy.ndarray:
+    if max_samples <= 0 or len(coords) <= max_samples:
+        return coords
+    return coords[::int(numpy.ceil(len(coords) / max_samples))]
+
+
+def shapes_match(
+    coords: numpy.ndarray,
+    reference: ReferenceShape,
+    tolerance: float,
+    max_samples: int = 0
+) -> bool:
+    if len(coords) == 0 or len(reference.coords) == 0:
+        return len(coords) == len(reference.coords)
+    # Bounding boxes of matching shapes can't differ by more than the tolerance, cheap reject
+    if numpy.abs(coords.min(axis=0) - reference.bounds_min).max() > tolerance or \
+            numpy.abs(coords.max(axis=0) - reference.bounds_max).max() > tolerance:
+        return False
+
+    if not reference.get_grid(tolerance).all_within(_subsample(coords, max_samples)):
+        return False
+    # Learner's mesh changes, its grid is built only when the first direction passed
+    learner_grid = PointGrid(coords, tolerance)
+    return learner_grid.all_within(_subsample(reference.coords, max_samples))
+
+
+def shape_matches_reference(
+    object_name: str,
+    reference_file: str,
+    tolerance: float,
+    max_samples: int = 0,
+    evaluated: bool = True
+) -> TestLambda:
+    """Object matches the reference within 'tolerance', 'max_samples' > 0 subsamples vertices"""
+    path = os.path.join(catalog.QUESTS_PATH, reference_file)
+
+    def snapshot() -> typing.Optional[typing.Tuple[numpy.ndarray, ReferenceShape]]:
+        reference = get_reference(path)
+        if reference is None:
+            return None
+        coords = geometry.get_coords(object_name, evaluated, test_cache.get_cycle())
+        if coords is None:
+            return None
+        return coords, reference
+
+    def evaluate(data: typing.Tuple[numpy.ndarray, ReferenceShape]) -> bool:
+        coords, reference = data
+        return shapes_match(coords, reference, tolerance, max_samples)
+    return background_check.expensive_test(snapshot, evaluate)
+
+
+def clear_cache() -> None:
+    _references.clear()
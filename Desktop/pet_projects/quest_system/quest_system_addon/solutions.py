@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Reference solutions of steps, used to validate quests headlessly. They are referenced from
+# quest packs the same way as tests and only use bpy.data, operators aren't available in
+# background mode.
+
+import bpy
+import bmesh
+import typing
+
+
+SolutionLambda = typing.Callable[[], None]
+
+
+class SolutionNotApplicable(Exception):
+    """Raised when the solution can't be performed in the current session, e.g. without UI"""
+    pass
+
+
+def _get_active_collection() -> bpy.types.Collection:
+    return bpy.context.view_layer.active_layer_collection.collection
+
+
+def delete_object(name: str) -> SolutionLambda:
+    def solution() -> None:
+        bpy.data.objects.remove(bpy.data.objects[name])
+    return solution
+
+
+def add_monkey(name: str = "Suzanne") -> SolutionLambda:
+    def solution() -> None:
+        mesh = bpy.data.meshes.new(name)
+        bm = bmesh.new()
+        bmesh.ops.create_monkey(bm)
+        bm.to_mesh(mesh)
+        bm.free()
+        _get_active_collection().objects.link(bpy.data.objects.new(name, mesh))
+    return solution
+
+
+def add_material(object_name: str, material_name: str) -> SolutionLambda:
+    def solution() -> None:
+        material = bpy.data.materials.new(material_name)
+        material.use_nodes = True
+        bpy.data.objects[object_name].data.materials.append(material)
+    return solution
+
+
+def set_base_color(material_name: str, color: typing.Sequence[float]) -> SolutionLambda:
+    def solution() -> None:
+        material = bpy.data.materials[material_name]
+        for node in material.node_tree.nodes:
+            if node.type == 'BSDF_PRINCIPLED':
+                node.inputs["Base Color"].default_value = color
+                return
+        raise RuntimeError(f"Material '{material_name}' has no Principled BSDF")
+    return solution
+
+
+def set_viewport_shading(shading_type: str) -> SolutionLambda:
+    def solution() -> None:
+        spaces = [
+            space
+            for window in bpy.context.window_manager.windows
+            for area in window.screen.areas if area.type == 'VIEW_3D'
+            for space in area.spaces if space.type == 'VIEW_3D'
+        ]
+        if len(spaces) == 0:
+            raise SolutionNotApplicable("There is no 3D viewport")
+        for space in spaces:
+            space.shading.type = shading_type
+    return solution
+
+
+SOLUTION_FACTORIES: typing.Dict[str, typing.Callable[..., SolutionLambda]] = {
+    "delete_object": delete_object,
+    "add_monkey": add_monkey,
+    "add_material": add_material,
+    "set_base_color": set_base_color,
+    "set_viewport_shading": set_viewport_shading,
+}
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Only preferences and panels are registered when Blender starts. Quest content, operators,
+# handlers and telemetry reporting are loaded the first time the sidebar panel is drawn, so the
+# add-on adds next to nothing to Blender launch time. Test libraries (numpy etc.) are imported
+# even later, by loader when a quest uses them.
+
+import sys
+import bpy
+import time
+import typing
+import logging
+import importlib
+
+
+if "polib" not in locals():
+    import polib
+    from . import profiling
+    from . import utils
+else:
+    polib = importlib.reload(polib)
+    profiling = importlib.reload(profiling)
+    utils = importlib.reload(utils)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+telemetry = polib.get_telemetry("quest_system")
+
+
+# Registered in this order, unregistered in reverse
+DEFERRED_MODULES = ("loader", "background_check", "logic", "auto_check", "authoring")
+
+# Deferred modules, None until loaded
+loader: typing.Any = None
+background_check: typing.Any = None
+logic: typing.Any = None
+auto_check: typing.Any = None
+authoring: typing.Any = None
+
+_loaded = False
+_load_scheduled = False
+
+
+def is_loaded() -> bool:
+    return _loaded
+
+
+def record_timing(name: str, duration: float) -> None:
+    profiling.record(f"startup:{name}", duration)
+    logger.info(f"quest_system {name} took {duration * 1000.0:.1f} ms")
+
+
+def ensure_loaded() -> None:
+    global _loaded
+    if _loaded:
+        return
+
+    start = time.perf_counter()
+    modules = []
+    for module_name in DEFERRED_MODULES:
+        full_name = f"{__package__}.{module_name}"
+        # Reload after the add-on itself was reloaded, like the eager imports do
+        if full_name in sys.modules:
+            module = importlib.reload(sys.modules[full_name])
+        else:
+            module = importlib.import_module(full_name)
+        globals()[module_name] = module
+        modules.append(module)
+    for module in modules:
+        module.register()
+    _loaded = True
+
+    addon = sys.modules[__package__]
+    telemetry.report_addon(addon.bl_info, addon.__file__)
+    record_timing("deferred_load", time.perf_counter() - start)
+
+
+def _load_from_timer() -> None:
+    global _load_scheduled
+    _load_scheduled = False
+    ensure_loaded()
+    utils.tag_view3d_redraw()
+
+
+def request_load() -> None:
+    """Loads the deferred modules soon, classes can't be registered while drawing"""
+    global _load_scheduled
+    if _loaded or _load_scheduled:
+        return
+    _load_scheduled = True
+    bpy.app.timers.register(_load_from_timer, first_interval=0.0)
+
+
+def register():
+    pass
+
+
+def unregister():
+    global _loaded
+    global _load_scheduled
+    if bpy.app.timers.is_registered(_load_from_timer):
+        bpy.app.timers.unregister(_load_from_timer)
+    _load_scheduled = False
+    if not _loaded:
+        return
+    for module_name in reversed(DEFERRED_MODULES):
+        globals()[module_name].unregister()
+    _loaded = False
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Start scenes of tasks are .blend templates. A template is appended only once, its objects are
+# kept aside as pristine copies with a fake user and every start of the task instantiates
+# copies of them, so restarting a task doesn't touch the disk. Pristine datablocks are marked by
+# a custom property, so they survive clearing the scene and saving and reopening the file.
+
+import bpy
+import typing
+import logging
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+# Value is the path of the template the datablock comes from
+TEMPLATE_PROPERTY = "quest_system_template"
+# Name the datablock had in the template, pristine copies are renamed so they don't clash
+ORIGINAL_NAME_PROPERTY = "quest_system_original_name"
+PRISTINE_NAME_PREFIX = "QS_TEMPLATE_"
+
+
+def is_template_datablock(datablock: bpy.types.ID) -> bool:
+    return TEMPLATE_PROPERTY in datablock
+
+
+def _iter_dependencies(obj: bpy.types.Object) -> typing.Iterator[bpy.types.ID]:
+    if obj.data is not None:
+        yield obj.data
+    materials = [slot.material for slot in obj.material_slots if slot.material is not None]
+    for material in materials:
+        yield material
+        if material.node_tree is None:
+            continue
+        for node in material.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image is not None:
+                yield node.image
+
+
+def _mark_pristine(datablock: bpy.types.ID, path: str) -> None:
+    if is_template_datablock(datablock):
+        return
+    datablock[TEMPLATE_PROPERTY] = path
+    datablock[ORIGINAL_NAME_PROPERTY] = datablock.name
+    datablock.name = PRISTINE_NAME_PREFIX + datablock.name
+    datablock.use_fake_user = True
+
+
+def _unmark_copy(datablock: bpy.types.ID) -> None:
+    original_name = datablock.get(ORIGINAL_NAME_PROPERTY, datablock.name)
+    for prop in (TEMPLATE_PROPERTY, ORIGINAL_NAME_PROPERTY):
+        if prop in datablock:
+            del datablock[prop]
+    datablock.use_fake_user = False
+    datablock.name = original_name
+
+
+class SceneTemplate:
+    def __init__(self, path: str, objects: typing.List[bpy.types.Object]) -> None:
+        self.path = path
+        self.objects = objects
+
+    def is_valid(self) -> bool:
+        try:
+            return all(obj.name is not None for obj in self.objects)
+        except ReferenceError:
+            return False
+
+    def instantiate(self, collection: bpy.types.Collection) -> typing.List[bpy.types.Object]:
+        copies: typing.Dict[bpy.types.Object, bpy.types.Object] = {}
+        copied_data: typing.Dict[bpy.types.ID, bpy.types.ID] = {}
+
+        def copy_datablock(datablock: bpy.types.ID) -> bpy.types.ID:
+            if datablock not in copied_data:
+                datablock_copy = datablock.copy()
+                _unmark_copy(datablock_copy)
+                copied_data[datablock] = datablock_copy
+            return copied_data[datablock]
+
+        for obj in self.objects:
+            obj_copy = obj.copy()
+            _unmark_copy(obj_copy)
+            if obj.data is not None:
+                obj_copy.data = copy_datablock(obj.data)
+            # Learner edits materials, they can't be shared with the pristine objects
+            for slot in obj_copy.material_slots:
+                if slot.material is not None and is_template_datablock(slot.material):
+                    slot.material = copy_datablock(slot.material)
+            collection.objects.link(obj_copy)
+            copies[obj] = obj_copy
+
+        for obj, obj_copy in copies.items():
+            if obj.parent in copies:
+                obj_copy.parent = copies[obj.parent]
+        return list(copies.values())
+
+
+_templates: typing.Dict[str, SceneTemplate] = {}
+
+
+def _find_pristine_objects(path: str) -> typing.List[bpy.types.Object]:
+    # Pristine objects are saved with the file, reuse them after the file is reopened
+    return [obj for obj in bpy.data.objects if obj.get(TEMPLATE_PROPERTY, None) == path]
+
+
+def _append_template(path: str) -> typing.List[bpy.types.Object]:
+    with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+        data_to.objects = list(data_from.objects)
+
+    objects = [obj for obj in data_to.objects if obj is not None]
+    for obj in objects:
+        for datablock in _iter_dependencies(obj):
+            _mark_pristine(datablock, path)
+        _mark_pristine(obj, path)
+    return objects
+
+
+def get_template(path: str) -> SceneTemplate:
+    template = _templates.get(path, None)
+    if template is not None and template.is_valid():
+        return template
+
+    objects = _find_pristine_objects(path)
+    if len(objects) == 0:
+        logger.info(f"Loading scene template '{path}'")
+        objects = _append_template(path)
+
+    template = SceneTemplate(path, objects)
+    _templates[path] = template
+    return template
+
+
+def clear_cache() -> None:
+    _templates.clear()
+
+
+@bpy.app.handlers.persistent
+def _load_post(*args) -> None:
+    # Loading a file invalidates all the datablocks we hold
+    clear_cache()
+
+
+def register():
+    bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(_load_post)
+    clear_cache()
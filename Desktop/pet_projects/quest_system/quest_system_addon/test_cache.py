@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Memoization of step tests. Every ID type has a change version which is bumped when the depsgraph
+# reports an update of that type. A test declaring the ID types it reads keeps its result until
+# one of their versions changes. Tests are only memoized inside a check cycle, within one cycle
+# every test (including tests called from other tests) is evaluated at most once.
+
+import bpy
+import typing
+import functools
+import contextlib
+
+
+TestLambda = typing.Callable[[], bool]
+
+
+# ID types we track, mapped to their bpy.data collection. The length of the collection is part
+# of the cache key as a cheap guard for additions and removals the depsgraph doesn't tag.
+ID_TYPE_COLLECTIONS: typing.Dict[str, typing.Optional[str]] = {
+    'OBJECT': "objects",
+    'MESH': "meshes",
+    'MATERIAL': "materials",
+    'NODETREE': "node_groups",
+    'COLLECTION': "collections",
+    'SCENE': "scenes",
+    'IMAGE': "images",
+    'LIGHT': "lights",
+    'CAMERA': "cameras",
+    'WORLD': "worlds",
+    'TEXTURE': "textures",
+}
+
+_versions: typing.Dict[str, int] = {}
+# Versions of individual datablocks by (ID type, name), only tracked for DATABLOCK_ID_TYPES
+_datablock_versions: typing.Dict[typing.Tuple[str, str], int] = {}
+DATABLOCK_ID_TYPES: typing.Dict[str, typing.Type[bpy.types.ID]] = {
+    'MATERIAL': bpy.types.Material,
+}
+# Bumped when everything has to be invalidated, e.g. after loading a file
+_epoch = 0
+
+_cycle = 0
+_cycle_active = False
+_cycle_uses_versions = False
+
+
+def bump(id_type: str) -> None:
+    _versions[id_type] = _versions.get(id_type, 0) + 1
+
+
+def bump_datablock(id_type: str, name: str) -> None:
+    key = (id_type, name)
+    _datablock_versions[key] = _datablock_versions.get(key, 0) + 1
+
+
+def get_version(id_type: str) -> int:
+    return _versions.get(id_type, 0)
+
+
+def get_datablock_version(id_type: str, name: str) -> typing.Tuple[int, int]:
+    return (_epoch, _datablock_versions.get((id_type, name), 0))
+
+
+def bump_all() -> None:
+    global _epoch
+    _epoch += 1
+
+
+def record_depsgraph_update(depsgraph: bpy.types.Depsgraph) -> None:
+    updated_datablock_types = []
+    for id_type in ID_TYPE_COLLECTIONS:
+        if depsgraph.id_type_updated(id_type):
+            bump(id_type)
+            if id_type in DATABLOCK_ID_TYPES:
+                updated_datablock_types.append((id_type, DATABLOCK_ID_TYPES[id_type]))
+
+    if len(updated_datablock_types) == 0:
+        return
+    for update in depsgraph.updates:
+        for id_type, id_class in updated_datablock_types:
+            if isinstance(update.id, id_class):
+                bump_datablock(id_type, update.id.name)
+
+
+def get_version_key(id_types: typing.Tuple[str, ...]) -> typing.Tuple[int, ...]:
+    key = [_epoch]
+    for id_type in id_types:
+        key.append(_versions.get(id_type, 0))
+        collection_name = ID_TYPE_COLLECTIONS.get(id_type, None)
+        if collection_name is not None:
+            key.append(len(getattr(bpy.data, collection_name)))
+    return tuple(key)
+
+
+@contextlib.contextmanager
+def check_cycle(use_versions: bool = True) -> typing.Iterator[None]:
+    """Memoizes tests evaluated inside the block.
+
+    With 'use_versions' results from previous cycles are reused if nothing the test depends on
+    changed since, otherwise tests are only deduplicated within this cycle.
+    """
+    global _cycle
+    global _cycle_active
+    global _cycle_uses_versions
+    if _cycle_active:
+        # Nested cycles share the outer one
+        yield
+        return
+
+    _cycle += 1
+    _cycle_active = True
+    _cycle_uses_versions = use_versions
+    try:
+        yield
+    finally:
+        _cycle_active = False
+
+
+def get_cycle() -> typing.Optional[int]:
+    """Returns id of the running check cycle, None outside of check cycles"""
+    return _cycle if _cycle_active else None
+
+
+def memoize(test: TestLambda, id_types: typing.Optional[typing.FrozenSet[str]]) -> TestLambda:
+    """Wraps 'test' so it is memoized in check cycles, 'id_types' None means it can read anything"""
+    sorted_id_types = tuple(sorted(id_types)) if id_types is not None else None
+    # (version key, cycle, result) of the last evaluation
+    last_result: typing.Optional[typing.Tuple[typing.Optional[typing.Tuple[int, ...]], int, bool]] = None
+
+    @functools.wraps(test)
+    def memoized_test() -> bool:
+        nonlocal last_result
+        if not _cycle_active:
+            return test()
+
+        key = None
+        if _cycle_uses_versions and sorted_id_types is not None:
+            key = get_version_key(sorted_id_types)
+        if last_result is not None:
+            last_key, last_cycle, result = last_result
+            if last_cycle == _cycle or (key is not None and last_key == key):
+                return result
+
+        result = test()
+        last_result = (key, _cycle, result)
+        return result
+
+    def get_memoized() -> typing.Tuple[typing.Optional[typing.Tuple[int, ...]], typing.Optional[bool]]:
+        """Returns (version key, memoized result or None) without evaluating the test.
+
+        Used for tests evaluated outside of the main thread, their result is stored later by
+        'store_result' under the key returned here, so changes made meanwhile still invalidate it.
+        """
+        key = None
+        if _cycle_active and _cycle_uses_versions and sorted_id_types is not None:
+            key = get_version_key(sorted_id_types)
+        if _cycle_active and last_result is not None:
+            last_key, last_cycle, result = last_result
+            if last_cycle == _cycle or (key is not None and last_key == key):
+                return key, result
+        return key, None
+
+    def store_result(key: typing.Optional[typing.Tuple[int, ...]], result: bool) -> None:
+        nonlocal last_result
+        last_result = (key, _cycle, result)
+
+    memoized_test.depends_on = id_types
+    memoized_test.get_memoized = get_memoized
+    memoized_test.store_result = store_result
+    return memoized_test
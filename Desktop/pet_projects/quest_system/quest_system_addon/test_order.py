@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Orders tests of a step so a failing check fails as cheaply as possible. The check stops at the
+# first failing test, so the expected cost of a check is the sum of test costs, each weighted by
+# the chance all tests before it passed. Running tests by ascending mean cost / failure chance
+# minimizes it. Both come from profiling of previous checks. Only reorderable tests move, i.e.
+# tests with declared dependencies which don't change the scene, and only among each other.
+
+import typing
+import logging
+
+
+if "profiling" not in locals():
+    from . import profiling
+else:
+    import importlib
+    profiling = importlib.reload(profiling)
+
+
+logger = logging.getLogger(f"polygoniq.{__name__}")
+
+
+TestLambda = typing.Callable[[], bool]
+
+
+# Tests are kept in place until they were evaluated at least this many times
+MIN_SAMPLES = 3
+
+
+# Last order of each step by step id, changes are logged
+_orders: typing.Dict[str, typing.Tuple[int, ...]] = {}
+
+
+def is_reorderable(test: TestLambda) -> bool:
+    return getattr(test, "reorderable", False)
+
+
+def get_test_name(step_id: str, label: str) -> str:
+    """Name of the test in profiling data"""
+    return f"test:{step_id}/{label}"
+
+
+def get_saving_name(step_id: str) -> str:
+    """Name of the estimated time saved by reordering tests of the step in profiling data"""
+    return f"test_order:{step_id}"
+
+
+def _estimate(name: str) -> typing.Optional[typing.Tuple[float, float]]:
+    """Returns (mean cost, failure chance) of the test, None if it wasn't sampled enough"""
+    stats = profiling.get_stats(name)
+    if stats is None or stats.passed + stats.failed < MIN_SAMPLES:
+        return None
+    # Smoothed, a test which never failed so far still can
+    return stats.mean, (stats.failed + 1) / (stats.passed + stats.failed + 2)
+
+
+def expected_cost(estimates: typing.Iterable[typing.Tuple[float, float]]) -> float:
+    cost = 0.0
+    pass_chance = 1.0
+    for test_cost, failure_chance in estimates:
+        cost += pass_chance * test_cost
+        pass_chance *= 1.0 - failure_chance
+    return cost
+
+
+def get_order(step_id: str, tests: typing.Sequence[TestLambda], labels: typing.Sequence[str]) -> typing.List[int]:
+    """Returns indices of 'tests' in the order they should be evaluated"""
+    estimates = [_estimate(get_test_name(step_id, label)) for label in labels]
+
+    def sort_key(i: int) -> typing.Tuple[typing.Any, ...]:
+        estimate = estimates[i]
+        if estimate is None:
+            # Keep declaration order until we know enough
+            return (0, i)
+        cost, failure_chance = estimate
+        return (1, cost / failure_chance, i)
+
+    order = list(range(len(tests)))
+    start = 0
+    while start < len(order):
+        if not is_reorderable(tests[start]):
+            start += 1
+            continue
+        # Tests which aren't reorderable split the step into runs sorted separately
+        end = start
+        while end < len(order) and is_reorderable(tests[end]):
+            end += 1
+        order[start:end] = sorted(order[start:end], key=sort_key)
+        start = end
+
+    _record_order(step_id, order, labels, estimates)
+    return order
+
+
+def _record_order(
+    step_id: str,
+    order: typing.List[int],
+    labels: typing.Sequence[str],
+    estimates: typing.List[typing.Optional[typing.Tuple[float, float]]]
+) -> None:
+    saving = None
+    if all(estimate is not None for estimate in estimates) and order != sorted(order):
+        declared_cost = expected_cost(estimates)
+        ordered_cost = expected_cost(estimates[i] for i in order)
+        saving = declared_cost - ordered_cost
+        profiling.record(get_saving_name(step_id), saving)
+
+    order_key = tuple(order)
+    if _orders.get(step_id, None) == order_key:
+        return
+    _orders[step_id] = order_key
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    saving_text = ""
+    if saving is not None:
+        saving_text = f", expected {declared_cost * 1000.0:.3f} ms -> {ordered_cost * 1000.0:.3f} ms " \
+            f"per check, {profiling.get_stats(get_saving_name(step_id)).total * 1000.0:.3f} ms saved so far"
+    logger.debug(f"Tests of step '{step_id}' ordered {[labels[i] for i in order]}{saving_text}")
+
+
+def iter_tests(
+    step_id: str,
+    tests: typing.Sequence[TestLambda],
+    labels: typing.Sequence[str]
+) -> typing.Iterator[typing.Tuple[TestLambda, str]]:
+    """Yields (test, profiling name) in the order the tests should be evaluated"""
+    for i in get_order(step_id, tests, labels):
+        yield tests[i], get_test_name(step_id, labels[i])
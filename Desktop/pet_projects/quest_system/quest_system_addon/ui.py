@@ -26,14 +26,16 @@ import typing
 if "polib" not in locals():
     import polib
     from . import preferences
-    from . import logic
-    from . import loader
+    from . import profiling
+    from . import startup
+    from . import utils
 else:
     import importlib
     polib = importlib.reload(polib)
     preferences = importlib.reload(preferences)
-    logic = importlib.reload(logic)
-    loader = importlib.reload(loader)
+    profiling = importlib.reload(profiling)
+    startup = importlib.reload(startup)
+    utils = importlib.reload(utils)
 
 
 telemetry = polib.get_telemetry("quest_system")
@@ -72,6 +74,87 @@ class QuestSystemPanelInfoMixin:
     bl_category = "polygoniq"
 
 
+LIST_ROWS = 8
+# Unlocked steps drawn with their Submit button, the rest are in the list above
+MAX_FRONTIER_BOXES = 4
+
+
+class TaskList(bpy.types.UIList):
+    bl_idname = "QUEST_SYSTEM_UL_tasks"
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        row = layout.row()
+        row.label(text=item.name)
+        row.operator(startup.logic.StartTask.bl_idname, text="", icon='PLAY').task_name = item.name
+
+
+MODULE_CLASSES.append(TaskList)
+
+
+STEP_STATE_ICONS = {
+    'LOCKED': 'LOCKED',
+    'AVAILABLE': 'CHECKBOX_DEHLT',
+    'COMPLETED': 'CHECKBOX_HLT',
+}
+
+
+class StepList(bpy.types.UIList):
+    bl_idname = "QUEST_SYSTEM_UL_steps"
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        row = layout.row()
+        row.label(text=item.name, icon=STEP_STATE_ICONS[item.state])
+        if item.state == 'COMPLETED' and startup.logic.can_rewind(item.step_id):
+            row.operator(startup.logic.RewindToStep.bl_idname, text="", icon='LOOP_BACK').step_id = item.step_id
+        elif item.state == 'AVAILABLE' and not startup.background_check.is_checking(item.step_id):
+            # Only a few unlocked steps get a box below the list, every one can be submitted here
+            row.operator(startup.logic.CheckCurrentStep.bl_idname, text="", icon='CHECKMARK').step_id = item.step_id
+        row.operator(ShowHint.bl_idname, text="", icon='QUESTION').message = item.description
+
+
+MODULE_CLASSES.append(StepList)
+
+
+# Key of the state prefs.available_tasks was built from. Drawing only compares the key, the list
+# is rebuilt outside of draw when the difficulty, the search query or the catalog changes.
+_available_tasks_key: typing.Optional[typing.Tuple[str, str, int]] = None
+_sync_scheduled = False
+
+
+def _get_available_tasks_key(prefs: preferences.Preferences) -> typing.Tuple[str, str, int]:
+    return (prefs.difficulty, prefs.search_query.strip(), startup.loader.get_catalog().version)
+
+
+def sync_available_tasks() -> None:
+    global _available_tasks_key
+    global _sync_scheduled
+    _sync_scheduled = False
+    prefs = preferences.get_preferences(bpy.context)
+    key = _get_available_tasks_key(prefs)
+    if key == _available_tasks_key:
+        return
+
+    prefs.available_tasks.clear()
+    # Searching ignores the difficulty, the best matches are listed first
+    query = prefs.search_query.strip()
+    task_names = startup.loader.search_tasks(query) if query != "" else \
+        startup.loader.get_available_tasks(prefs.difficulty)
+    for task_name in task_names:
+        prefs.available_tasks.add().name = task_name
+    prefs.available_tasks_index = 0
+    _available_tasks_key = key
+    utils.tag_view3d_redraw()
+
+
+def _ensure_available_tasks(prefs: preferences.Preferences) -> None:
+    global _sync_scheduled
+    if _sync_scheduled or _get_available_tasks_key(prefs) == _available_tasks_key:
+        return
+    # Data shouldn't be written while drawing
+    _sync_scheduled = True
+    bpy.app.timers.register(sync_available_tasks, first_interval=0.0)
+
+
 class QuestSystemPanel(QuestSystemPanelInfoMixin, bpy.types.Panel):
     bl_idname = "VIEW_3D_PT_quest_system"
     bl_label = "quest"
@@ -85,17 +168,28 @@ class QuestSystemPanel(QuestSystemPanelInfoMixin, bpy.types.Panel):
         self.layout.label(text="", icon='ANIM')
 
     def draw(self, context: bpy.types.Context):
+        with profiling.measure("draw:QuestSystemPanel"):
+            self._draw(context)
+
+    def _draw(self, context: bpy.types.Context):
         # I moved this UI from preferences to here. It was the easiest way how not to get circular
         # dependencies, hope it's not problem as we discussed people don't look in preferences.
         prefs = preferences.get_preferences(context)
-        task_names = loader.get_available_tasks(prefs.difficulty)
         row = self.layout.row()
         row.prop(prefs, "difficulty")
-        box = self.layout.box()
-        for task_name in task_names:
-            row = box.row()
-            row.label(text=task_name)
-            row.operator(logic.StartTask.bl_idname, text="", icon='PLAY').task_name = task_name
+        if not startup.is_loaded():
+            # Quests are loaded the first time the panel is shown, not on Blender startup
+            startup.request_load()
+            self.layout.label(text="Loading quests...", icon='TIME')
+            return
+
+        row = self.layout.row()
+        row.prop(prefs, "search_query", text="", icon='VIEWZOOM')
+        _ensure_available_tasks(prefs)
+        # UIList only draws the visible rows, no matter how many quests are installed
+        self.layout.template_list(
+            TaskList.bl_idname, "", prefs, "available_tasks", prefs, "available_tasks_index",
+            rows=LIST_ROWS)
 
         box = self.layout.box()
         row = box.row()
@@ -106,7 +200,7 @@ class QuestSystemPanel(QuestSystemPanelInfoMixin, bpy.types.Panel):
         self.layout.separator()
         row = self.layout.row()
         row.alert = True
-        row.operator(logic.StartTask.bl_idname, text="Restart Task").task_name = prefs.task.name
+        row.operator(startup.logic.StartTask.bl_idname, text="Restart Task").task_name = prefs.task.name
 
 
 MODULE_CLASSES.append(QuestSystemPanel)
@@ -122,17 +216,37 @@ class QuestStepsPanel(QuestSystemPanelInfoMixin, bpy.types.Panel):
         self.layout.label(text="", icon='WORDWRAP_OFF')
 
     def draw(self, context: bpy.types.Context):
+        with profiling.measure("draw:QuestStepsPanel"):
+            self._draw(context)
+
+    def _draw(self, context: bpy.types.Context):
+        if not startup.is_loaded():
+            startup.request_load()
+            self.layout.label(text="Loading quests...", icon='TIME')
+            return
+
         prefs = preferences.get_preferences(context)
-        for i, step in enumerate(prefs.task.steps):
-            row = self.layout.row()
-            step_icon = 'CHECKBOX_HLT' if i < prefs.task.current_step else 'CHECKBOX_DEHLT'
-            row.label(text=step.name, icon=step_icon)
-            col = row.column()
-            prop = col.operator(ShowHint.bl_idname, text="", icon='QUESTION')
-            prop.message = step.description
-            if i == prefs.task.current_step:
-                row = self.layout.row()
-                row.operator(logic.CheckCurrentStep.bl_idname, text="Submit Current Step")
+        self.layout.template_list(
+            StepList.bl_idname, "", prefs.task, "steps", prefs.task, "steps_index", rows=LIST_ROWS)
+
+        # Steps which don't depend on each other can be done in any order, a few of them are shown
+        for step in prefs.task.get_frontier(MAX_FRONTIER_BOXES):
+            box = self.layout.box()
+            row = box.row()
+            row.label(text=step.name)
+            row.operator(ShowHint.bl_idname, text="", icon='QUESTION').message = step.description
+            row = box.row()
+            if startup.background_check.is_checking(step.step_id):
+                # Expensive tests are evaluated in the background, the UI stays responsive
+                row.label(text="Checking...", icon='SORTTIME')
+            else:
+                row.operator(startup.logic.CheckCurrentStep.bl_idname, text="Submit Step").step_id = step.step_id
+        hidden_count = prefs.task.get_frontier_size() - MAX_FRONTIER_BOXES
+        if hidden_count > 0:
+            self.layout.label(text=f"+{hidden_count} more unlocked steps", icon='THREE_DOTS')
+
+        row = self.layout.row()
+        row.prop(prefs, "auto_check")
 
 
 MODULE_CLASSES.append(QuestStepsPanel)
@@ -146,5 +260,11 @@ def register(panel_name: str = "Quests"):
 
 
 def unregister():
+    global _available_tasks_key
+    global _sync_scheduled
+    if bpy.app.timers.is_registered(sync_available_tasks):
+        bpy.app.timers.unregister(sync_available_tasks)
+    _available_tasks_key = None
+    _sync_scheduled = False
     for cls in reversed(MODULE_CLASSES):
         bpy.utils.unregister_class(cls)
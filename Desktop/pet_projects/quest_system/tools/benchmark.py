@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Benchmarks of the hot paths of the add-on against synthetic catalogs. Run headless:
+#   blender --background --factory-startup --python benchmark.py -- --output results.json
+# and compare two runs, e.g. before and after a commit, with regular Python:
+#   python benchmark.py compare old.json new.json [--threshold 0.2]
+
+import os
+import sys
+import json
+import time
+import types
+import typing
+import argparse
+import statistics
+import subprocess
+
+
+ADDON_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "quest_system_addon"))
+DEFAULT_SIZES = (10, 1000, 10000)
+DEFAULT_REPEATS = 20
+
+
+class _RecordingLayout:
+    """Stands in for bpy.types.UILayout, panels can't draw in background mode"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def _record(self, *args, **kwargs) -> '_RecordingLayout':
+        self.calls += 1
+        return self
+
+    row = column = box = split = label = prop = separator = template_list = _record
+
+    def operator(self, *args, **kwargs) -> typing.Any:
+        self.calls += 1
+        return _OperatorProperties()
+
+
+class _OperatorProperties:
+    # Accepts any property assignment like the real OperatorProperties
+    pass
+
+
+class _PanelStub:
+    def __init__(self, panel_class: typing.Type) -> None:
+        self.layout = _RecordingLayout()
+        self._panel_class = panel_class
+
+    def __getattr__(self, name: str) -> typing.Any:
+        # Methods of the panel, e.g. helpers called from draw, bound to the stub
+        return types.MethodType(getattr(self._panel_class, name), self)
+
+    def draw(self, context: typing.Any) -> None:
+        self._panel_class.draw(self, context)
+
+
+class _OperatorStub:
+    def __init__(self, step_id: str = "") -> None:
+        self.step_id = step_id
+        self.reports: typing.List[str] = []
+
+    def report(self, type_: typing.Set[str], message: str) -> None:
+        self.reports.append(message)
+
+
+def _measure(function: typing.Callable[[], typing.Any], repeats: int) -> typing.Dict[str, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+        "repeats": repeats,
+    }
+
+
+def run_benchmarks(sizes: typing.Iterable[int], repeats: int) -> typing.Dict[str, typing.Any]:
+    import bpy
+    import addon_utils
+
+    package = os.path.basename(ADDON_DIR)
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    addon_utils.enable(package, default_set=True, handle_error=None)
+    sys.modules[f"{package}.startup"].ensure_loaded()
+    catalog = sys.modules[f"{package}.catalog"]
+    loader = sys.modules[f"{package}.loader"]
+    logic = sys.modules[f"{package}.logic"]
+    ui = sys.modules[f"{package}.ui"]
+    prefs = bpy.context.preferences.addons[package].preferences
+    context = bpy.context
+
+    results: typing.Dict[str, typing.Dict[str, float]] = {}
+    # The real start scene is measured separately, synthetic tasks don't prepare anything
+    results["load_task/default_scene"] = _measure(loader.mock_startup_blend, repeats)
+
+    original_catalog = loader._catalog
+    try:
+        for size in sizes:
+            synthetic_catalog = catalog.Catalog()
+            for i in range(size):
+                synthetic_catalog.add(loader.Task(
+                    f"Task {i}",
+                    f"Synthetic task number {i}",
+                    'BEGINNER',
+                    [
+                        loader.Step(f"Step {j}", f"Synthetic step number {j}", [lambda: True])
+                        for j in range(size if i == 0 else 1)
+                    ],
+                    prepare_blend=lambda: None
+                ))
+            loader._catalog = synthetic_catalog
+            prefs.difficulty = 'BEGINNER'
+
+            # The first task has 'size' steps
+            results[f"load_task/{size}"] = _measure(lambda: loader.load_task("Task 0", prefs), repeats)
+
+            def sync_available_tasks() -> None:
+                ui._available_tasks_key = None
+                ui.sync_available_tasks()
+            results[f"sync_available_tasks/{size}"] = _measure(sync_available_tasks, repeats)
+            results[f"draw/QuestSystemPanel/{size}"] = _measure(
+                lambda: _PanelStub(ui.QuestSystemPanel).draw(context), repeats)
+            results[f"draw/QuestStepsPanel/{size}"] = _measure(
+                lambda: _PanelStub(ui.QuestStepsPanel).draw(context), repeats)
+
+            # Last step is the worst case for finding the step of the task
+            task = loader.get_catalog().get("Task 0")
+            last_step = task.steps[-1]
+            loader.apply_progress(task, prefs.task, {step.id for step in task.steps[:-1]})
+
+            def check_last_step() -> None:
+                # Through set_step_state, the unlocked steps are tracked outside of the properties
+                prefs.task.set_step_state(size - 1, 'AVAILABLE')
+                operator = _OperatorStub(last_step.id)
+                result = logic.CheckCurrentStep.execute(operator, context)
+                if result != {'FINISHED'}:
+                    raise RuntimeError(f"Checking the last step didn't finish: {operator.reports}")
+            results[f"check_current_step/{size}"] = _measure(check_last_step, repeats)
+    finally:
+        loader._catalog = original_catalog
+        loader.current_task = None
+
+    return results
+
+
+def _get_commit() -> typing.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ADDON_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_main(argv: typing.List[str]) -> None:
+    import bpy
+
+    parser = argparse.ArgumentParser(description="Benchmarks the add-on inside Blender")
+    parser.add_argument("--output", help="Path of the JSON results, printed to stdout if not given")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": _get_commit(),
+        "blender_version": bpy.app.version_string,
+        "timestamp": time.time(),
+        "results": run_benchmarks(args.sizes, args.repeats),
+    }
+    report_json = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_json)
+    else:
+        print(report_json)
+
+
+def compare_main(argv: typing.List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Compares two benchmark results")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Relative slowdown of the median reported as regression")
+    args = parser.parse_args(argv)
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = 0
+    print(f"{'benchmark':<40} {'old [ms]':>12} {'new [ms]':>12} {'ratio':>8}")
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        if name not in old["results"] or name not in new["results"]:
+            print(f"{name:<40} {'only in ' + ('new' if name in new['results'] else 'old'):>34}")
+            continue
+        old_median = old["results"][name]["median"]
+        new_median = new["results"][name]["median"]
+        ratio = new_median / old_median if old_median > 0.0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + args.threshold:
+            flag = " REGRESSION"
+            regressions += 1
+        print(f"{name:<40} {old_median * 1000:>12.3f} {new_median * 1000:>12.3f} {ratio:>8.2f}{flag}")
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    try:
+        import bpy
+    except ImportError:
+        if len(sys.argv) < 2 or sys.argv[1] != "compare":
+            print("Run inside Blender to benchmark, or use 'compare OLD NEW'", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(compare_main(sys.argv[2:]))
+    else:
+        benchmark_main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Restarts a task many times in a row and checks nothing leaks. Between restarts the reference
+# solutions of all steps are applied, like a learner would create data. Run headless:
+#   blender --background --factory-startup --python restart_soak.py -- --task "Red Monkey" --restarts 1000
+# Exits with 1 if the number of datablocks grows or memory grows more than --max-memory-growth.
+
+import os
+import sys
+import json
+import typing
+import argparse
+
+
+ADDON_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "quest_system_addon"))
+DEFAULT_RESTARTS = 1000
+# Restarts before the measured baseline, allocators and caches settle during the first few
+WARMUP_RESTARTS = 10
+SAMPLE_INTERVAL = 100
+
+
+def run_soak(task_name: str, restarts: int) -> typing.Dict[str, typing.Any]:
+    import bpy
+    import addon_utils
+
+    package = os.path.basename(ADDON_DIR)
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    addon_utils.enable(package, default_set=True, handle_error=None)
+    sys.modules[f"{package}.startup"].ensure_loaded()
+    loader = sys.modules[f"{package}.loader"]
+    sandbox = sys.modules[f"{package}.sandbox"]
+    prefs = bpy.context.preferences.addons[package].preferences
+
+    samples = []
+    for i in range(WARMUP_RESTARTS + restarts):
+        if not loader.load_task(task_name, prefs):
+            raise RuntimeError(f"Task '{task_name}' couldn't be loaded")
+        for step in loader.current_task.steps:
+            if step.solution is None:
+                continue
+            try:
+                step.solution()
+            except Exception:
+                # e.g. viewport shading in background mode, the rest of the data is still created
+                pass
+
+        restart = i - WARMUP_RESTARTS
+        if restart >= 0 and (restart % SAMPLE_INTERVAL == 0 or restart == restarts - 1):
+            samples.append({
+                "restart": restart,
+                "datablocks": sandbox.count_datablocks(),
+                "memory": sandbox.get_memory_usage(),
+            })
+
+    last_report = sandbox.get_last_report()
+    return {
+        "task": task_name,
+        "restarts": restarts,
+        "samples": samples,
+        "last_restore": last_report.to_dict() if last_report is not None else None,
+    }
+
+
+def soak_main(argv: typing.List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Restarts a task repeatedly and checks for leaks")
+    parser.add_argument("--task", required=True)
+    parser.add_argument("--restarts", type=int, default=DEFAULT_RESTARTS)
+    parser.add_argument(
+        "--max-memory-growth", type=float, default=64.0, help="Allowed growth of resident memory in MiB")
+    parser.add_argument("--output", help="Path of the JSON report, printed to stdout if not given")
+    args = parser.parse_args(argv)
+
+    report = run_soak(args.task, args.restarts)
+    first, last = report["samples"][0], report["samples"][-1]
+    problems = []
+    if last["datablocks"] > first["datablocks"]:
+        problems.append(f"datablocks grew from {first['datablocks']} to {last['datablocks']}")
+    if first["memory"] is not None and last["memory"] is not None:
+        growth = (last["memory"] - first["memory"]) / 2**20
+        report["memory_growth_mib"] = growth
+        if growth > args.max_memory_growth:
+            problems.append(f"memory grew by {growth:.1f} MiB")
+    report["ok"] = len(problems) == 0
+
+    report_json = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_json)
+    else:
+        print(report_json)
+    for problem in problems:
+        print(f"LEAK {problem}", file=sys.stderr)
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(soak_main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Validates quests by running their reference solutions in background Blender instances. For every
+# step all its tests have to be False before the solution of the step is applied and True after.
+#
+# Run with regular Python, tasks are spread across a pool of Blender processes:
+#   python validate_quests.py --blender /path/to/blender --jobs 16 --output report.json [TASK ...]
+#
+# The same script is the worker executed inside each Blender instance.
+
+import os
+import sys
+import json
+import time
+import typing
+import argparse
+import subprocess
+import importlib
+import importlib.util
+import concurrent.futures
+
+
+ADDON_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "quest_system_addon"))
+RESULT_MARKER = "QUEST_VALIDATION_RESULT:"
+DEFAULT_TIMEOUT = 600.0
+
+
+def _load_catalog_module() -> typing.Any:
+    # catalog doesn't depend on bpy, so we can list tasks without starting Blender
+    spec = importlib.util.spec_from_file_location("catalog", os.path.join(ADDON_DIR, "catalog.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def validate_task_in_blender(task_name: str, addon_dir: str) -> typing.Dict[str, typing.Any]:
+    import bpy
+    import addon_utils
+
+    package = os.path.basename(addon_dir)
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    addon_utils.enable(package, default_set=True, handle_error=None)
+    # Quest modules are deferred until the panel is drawn, there is no UI in background mode
+    sys.modules[f"{package}.startup"].ensure_loaded()
+    loader = sys.modules[f"{package}.loader"]
+    logic = sys.modules[f"{package}.logic"]
+    solutions = importlib.import_module(f"{package}.solutions")
+    test_cache = sys.modules[f"{package}.test_cache"]
+    prefs = bpy.context.preferences.addons[package].preferences
+
+    def evaluate_tests(step: typing.Any) -> typing.List[bool]:
+        with test_cache.check_cycle(use_versions=False):
+            return [bool(test()) for test in step.tests]
+
+    result: typing.Dict[str, typing.Any] = {"task": task_name, "ok": False, "error": None, "steps": []}
+    task_start = time.perf_counter()
+    start = time.perf_counter()
+    if not loader.load_task(task_name, prefs):
+        result["error"] = "Task couldn't be loaded"
+        return result
+    result["load_time"] = time.perf_counter() - start
+    result["id"] = loader.current_task.id
+
+    ok = True
+    for index, step in enumerate(loader.current_task.steps):
+        step_result: typing.Dict[str, typing.Any] = {
+            "index": index, "name": step.name, "status": "passed", "error": None}
+        result["steps"].append(step_result)
+        step_result["tests_before"] = evaluate_tests(step)
+
+        if step.solution is None:
+            step_result["status"] = "skipped"
+            step_result["error"] = "Step has no reference solution"
+            continue
+
+        start = time.perf_counter()
+        try:
+            step.solution()
+        except solutions.SolutionNotApplicable as e:
+            step_result["status"] = "skipped"
+            step_result["error"] = str(e)
+            continue
+        except Exception as e:
+            step_result["status"] = "failed"
+            step_result["error"] = f"Solution raised {type(e).__name__}: {e}"
+            ok = False
+            continue
+        step_result["solution_time"] = time.perf_counter() - start
+        # Data changed by the solution has to be evaluated before tests read it
+        bpy.context.view_layer.update()
+
+        start = time.perf_counter()
+        step_result["tests_after"] = evaluate_tests(step)
+        passed = logic.check_step(step, use_cache=False)
+        step_result["check_time"] = time.perf_counter() - start
+
+        if any(step_result["tests_before"]):
+            step_result["status"] = "failed"
+            step_result["error"] = "Some tests passed before the solution was applied"
+        elif not passed:
+            step_result["status"] = "failed"
+            step_result["error"] = "Some tests didn't pass after the solution was applied"
+        else:
+            logic.complete_step(prefs, step)
+
+        ok = ok and step_result["status"] != "failed"
+
+    result["ok"] = ok
+    result["total_time"] = time.perf_counter() - task_start
+    return result
+
+
+def worker_main(argv: typing.List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Validates one quest inside Blender")
+    parser.add_argument("--addon-dir", required=True)
+    parser.add_argument("--task", required=True)
+    args = parser.parse_args(argv)
+
+    try:
+        result = validate_task_in_blender(args.task, args.addon_dir)
+    except Exception as e:
+        result = {"task": args.task, "ok": False, "error": f"{type(e).__name__}: {e}", "steps": []}
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+
+
+def run_blender_worker(blender: str, task_name: str, timeout: float) -> typing.Dict[str, typing.Any]:
+    command = [
+        blender, "--background", "--factory-startup", "--python", os.path.abspath(__file__),
+        "--", "--addon-dir", ADDON_DIR, "--task", task_name
+    ]
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"task": task_name, "ok": False, "error": f"Timed out after {timeout}s", "steps": []}
+
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            result = json.loads(line[len(RESULT_MARKER):])
+            break
+    else:
+        result = {
+            "task": task_name,
+            "ok": False,
+            "error": f"Blender exited with {process.returncode} without result",
+            "stderr": process.stderr[-4000:],
+            "steps": []
+        }
+    result["process_time"] = time.perf_counter() - start
+    return result
+
+
+def main(argv: typing.List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Validates quests in parallel background Blender instances")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"))
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Per task timeout in seconds")
+    parser.add_argument("--output", help="Path of the JSON report, printed to stdout if not given")
+    parser.add_argument("tasks", nargs="*", help="Names of tasks to validate, all tasks if not given")
+    args = parser.parse_args(argv)
+
+    task_names = args.tasks
+    if len(task_names) == 0:
+        catalog = _load_catalog_module()
+        task_names = [entry.name for entry in catalog.build_catalog_entries(catalog.QUESTS_PATH)]
+
+    start = time.perf_counter()
+    # Threads only wait for the Blender processes which do the actual work
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(
+            lambda task_name: run_blender_worker(args.blender, task_name, args.timeout), task_names))
+
+    report = {
+        "blender": args.blender,
+        "jobs": args.jobs,
+        "total_time": time.perf_counter() - start,
+        "ok": all(result["ok"] for result in results),
+        "tasks": results
+    }
+    report_json = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_json)
+    else:
+        print(report_json)
+
+    for result in results:
+        if not result["ok"]:
+            print(f"FAILED {result['task']}: {result.get('error', None) or 'see report'}", file=sys.stderr)
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    try:
+        import bpy
+    except ImportError:
+        sys.exit(main(sys.argv[1:]))
+    else:
+        worker_main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])